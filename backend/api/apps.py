@@ -4,3 +4,27 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.models.signals import (m2m_changed, post_delete,
+                                              post_save, pre_delete)
+        from rest_framework.authtoken.models import Token
+
+        from recipes.models import Recipe, User
+        from . import authentication, metrics, response_cache
+
+        metrics.instrument_serializers()
+
+        post_save.connect(response_cache.recipe_saved, sender=Recipe,
+                          dispatch_uid='anon_cache_recipe_saved')
+        pre_delete.connect(response_cache.recipe_deleted, sender=Recipe,
+                           dispatch_uid='anon_cache_recipe_deleted')
+        m2m_changed.connect(response_cache.recipe_tags_changed,
+                            sender=Recipe.tags.through,
+                            dispatch_uid='anon_cache_recipe_tags_changed')
+        post_save.connect(response_cache.user_saved, sender=User,
+                          dispatch_uid='anon_cache_user_saved')
+        post_save.connect(authentication.user_saved, sender=User,
+                          dispatch_uid='auth_token_cache_user_saved')
+        post_delete.connect(authentication.token_deleted, sender=Token,
+                            dispatch_uid='auth_token_cache_token_deleted')
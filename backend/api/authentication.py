@@ -0,0 +1,52 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router, transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+def get_cache_key(key):
+    return f'auth_token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def get_cached_fields():
+    # Хэш пароля в общий кэш не попадает: поле остаётся отложенным
+    # и загружается из БД только при обращении к нему.
+    return [field.attname for field in get_user_model()._meta.concrete_fields
+            if field.attname != 'password']
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cache_key = get_cache_key(key)
+        values = cache.get(cache_key)
+        if values is not None:
+            User = get_user_model()
+            user = User.from_db(router.db_for_read(User), get_cached_fields(),
+                                values)
+            return user, Token(key=key, user=user)
+        user, token = super().authenticate_credentials(key)
+        cache.set(cache_key,
+                  [getattr(user, name) for name in get_cached_fields()],
+                  settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        return user, token
+
+
+def drop_cached_tokens(keys):
+    # Удаление повторяется после коммита: запрос, пришедший до него,
+    # мог снова закэшировать прежнего пользователя.
+    cache_keys = [get_cache_key(key) for key in keys]
+    cache.delete_many(cache_keys)
+    transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+
+def token_deleted(sender, instance, **kwargs):
+    drop_cached_tokens([instance.key])
+
+
+def user_saved(sender, instance, **kwargs):
+    drop_cached_tokens(
+        Token.objects.filter(user=instance).values_list('key', flat=True))
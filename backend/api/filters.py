@@ -1,7 +1,10 @@
 from django_filters import rest_framework as filters
 from django.contrib.auth.models import AnonymousUser
-from recipes.models import Recipe
-from django.db.models import Q
+from recipes.catalog import tag_catalog
+from recipes.models import Recipe, RecipeTag
+from recipes.user_recipes import favorite_ids, shopping_cart_ids
+from django.db.models import Count
+from .search import search_recipes
 
 
 class RecipeFilter(filters.FilterSet):
@@ -15,41 +18,46 @@ class RecipeFilter(filters.FilterSet):
         field_name='shopping_cart_users__user',
         method='filter_in_shopping_cart')
     author = filters.NumberFilter(field_name='author__id')
+    search = filters.CharFilter(method='filter_search')
 
     def filter_tags(self, queryset, name, value):
-        tags = self.request.GET.getlist('tags')
-        if tags:
-            tag_queries = [Q(tags__slug=tag) for tag in tags]
-            combined_query = Q()
-            for query in tag_queries:
-                combined_query |= query
-            queryset = queryset.filter(combined_query).distinct()
-        else:
-            queryset = queryset.none()
-        return queryset
+        tags = set(self.request.GET.getlist('tags'))
+        tag_ids = [tag.id for tag in tag_catalog.all() if tag.slug in tags]
+        if not tag_ids:
+            return queryset.none()
+        recipe_tags = RecipeTag.objects.filter(tag_id__in=tag_ids)
+        if self.request.GET.get('tags_mode') == 'all':
+            if len(tag_ids) < len(tags):
+                return queryset.none()
+            recipe_tags = recipe_tags.values('recipe_id').annotate(
+                tags_count=Count('tag_id')
+            ).filter(tags_count=len(tag_ids))
+        return queryset.filter(id__in=recipe_tags.values('recipe_id'))
 
     def filter_favorited(self, queryset, name, value):
         if not isinstance(self.request.user, AnonymousUser):
+            ids = favorite_ids.get(self.request)
             if value:
-                return queryset.filter(
-                    users_who_favorited__user=self.request.user)
+                return queryset.filter(id__in=ids)
             else:
-                return queryset.exclude(
-                    users_who_favorited__user=self.request.user)
+                return queryset.exclude(id__in=ids)
         else:
             return queryset
 
     def filter_in_shopping_cart(self, queryset, name, value):
         if not isinstance(self.request.user, AnonymousUser):
+            ids = shopping_cart_ids.get(self.request)
             if value:
-                return queryset.filter(
-                    shopping_cart_users__user=self.request.user)
+                return queryset.filter(id__in=ids)
             else:
-                return queryset.exclude(
-                    shopping_cart_users__user=self.request.user)
+                return queryset.exclude(id__in=ids)
         else:
             return queryset
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
     class Meta:
         model = Recipe
-        fields = ['tags', 'is_favorited', 'is_in_shopping_cart', 'author']
+        fields = ['tags', 'is_favorited', 'is_in_shopping_cart', 'author',
+                  'search']
@@ -0,0 +1,96 @@
+import base64
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+
+from recipes.models import Recipe
+from recipes.storage import IMAGE_VARIANTS, variant_name
+from .response_cache import bump
+
+logger = logging.getLogger(__name__)
+
+# Размер куска должен делиться на 4, чтобы каждый кусок декодировался
+# независимо от остальных.
+CHUNK_SIZE = 4 * 16 * 1024
+VARIANT_SIZES = {
+    'thumbnail': (320, 320),
+    'card': (960, 960),
+}
+
+image_executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_VARIANT_WORKERS,
+    thread_name_prefix='image-variants')
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def decoded_size(data):
+    return len(data) * 3 // 4 - data[-2:].count('=')
+
+
+def decode_base64(data, name, max_size):
+    if decoded_size(data) > max_size:
+        raise ImageTooLarge
+    file = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    for start in range(0, len(data), CHUNK_SIZE):
+        file.write(base64.b64decode(data[start:start + CHUNK_SIZE],
+                                    validate=True))
+    file.seek(0)
+    return File(file, name=name)
+
+
+def render_variants(name):
+    from PIL import Image
+
+    with default_storage.open(name) as source, Image.open(source) as image:
+        image.load()
+        for variant in IMAGE_VARIANTS:
+            target = variant_name(name, variant)
+            if default_storage.exists(target):
+                continue
+            resized = image.copy()
+            resized.thumbnail(VARIANT_SIZES[variant])
+            if resized.mode not in ('RGB', 'RGBA'):
+                resized = resized.convert('RGBA')
+            buffer = BytesIO()
+            resized.save(buffer, 'WEBP',
+                         quality=settings.IMAGE_VARIANT_QUALITY)
+            saved = default_storage.save(target,
+                                         ContentFile(buffer.getvalue()))
+            # Вариант уже сохранил параллельный обработчик того же файла.
+            if saved != target:
+                default_storage.delete(saved)
+
+
+def generate_variants(name):
+    try:
+        render_variants(name)
+        recipe_ids = Recipe.objects.filter(
+            image=name).values_list('id', flat=True)
+        bump(*(f'recipe:{recipe_id}' for recipe_id in recipe_ids))
+    except Exception:
+        logger.exception('Не удалось подготовить варианты %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(name):
+    transaction.on_commit(
+        lambda: image_executor.submit(generate_variants, name))
+
+
+def get_variant_url(file, variant):
+    name = variant_name(file.name, variant)
+    if file.storage.exists(name):
+        return file.storage.url(name)
+    return None
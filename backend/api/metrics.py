@@ -0,0 +1,197 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from rest_framework.serializers import BaseSerializer
+
+from . import response_cache
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+NUMBER_RE = re.compile(r'\b\d+\b')
+ROUTE_ANCHOR_RE = re.compile(r'(^|/)\^')
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+def fingerprint(sql):
+    return NUMBER_RE.sub('?', IN_LIST_RE.sub('(...)', sql))
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(
+            lambda: Histogram(settings.METRICS_LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.totals = defaultdict(lambda: defaultdict(float))
+
+    def record(self, labels, duration, metrics, response_size):
+        with self.lock:
+            self.latency[labels].observe(duration)
+            self.queries[labels].observe(metrics.queries)
+            totals = self.totals[labels]
+            totals['db_seconds'] += metrics.query_time
+            totals['serializer_seconds'] += metrics.serializer_time
+            totals['response_bytes'] += response_size
+
+    def render_histogram(self, lines, name, histograms):
+        lines.append(f'# TYPE {name} histogram')
+        for (method, route), histogram in sorted(histograms.items()):
+            labels = f'method="{method}",route="{route}"'
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(
+                    f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(
+                f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+    def render(self):
+        lines = []
+        with self.lock:
+            self.render_histogram(
+                lines, 'foodgram_request_duration_seconds', self.latency)
+            self.render_histogram(
+                lines, 'foodgram_request_db_queries', self.queries)
+            for total in ('db_seconds', 'serializer_seconds',
+                          'response_bytes'):
+                name = f'foodgram_request_{total}_total'
+                lines.append(f'# TYPE {name} counter')
+                for (method, route), totals in sorted(self.totals.items()):
+                    lines.append(
+                        f'{name}{{method="{method}",route="{route}"}} '
+                        f'{totals[total]}')
+        for event, value in response_cache.get_stats().items():
+            name = f'foodgram_anonymous_cache_{event}_total'
+            lines.append(f'# TYPE {name} counter')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def timed_data(data):
+    def wrapper(serializer):
+        metrics = current_metrics.get()
+        # Вложенные сериализаторы уже учтены во времени внешнего.
+        if metrics is None or metrics.serializer_depth:
+            return data.fget(serializer)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_depth -= 1
+    return property(wrapper)
+
+
+def instrument_serializers():
+    if not isinstance(BaseSerializer.data, property):
+        return
+    if getattr(BaseSerializer.data.fget, 'instrumented', False):
+        return
+    BaseSerializer.data = timed_data(BaseSerializer.data)
+    BaseSerializer.data.fget.instrumented = True
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return '/' + ROUTE_ANCHOR_RE.sub(r'\1', match.route).rstrip('$')
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        if response.streaming:
+            # Содержимое формируется уже после возврата из view: запросы
+            # и время учитываются, пока сервер читает генератор.
+            response.streaming_content = self.stream(
+                request, response.streaming_content, metrics, started)
+        else:
+            self.record(request, metrics, started, len(response.content))
+        return response
+
+    def stream(self, request, content, metrics, started):
+        size = 0
+        try:
+            with connection.execute_wrapper(metrics):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.record(request, metrics, started, size)
+
+    def record(self, request, metrics, started, size):
+        duration = time.perf_counter() - started
+        labels = (request.method, get_route(request))
+        registry.record(labels, duration, metrics, size)
+        if (metrics.queries > settings.METRICS_QUERY_BUDGET
+                or duration > settings.METRICS_LATENCY_BUDGET):
+            logger.warning(
+                '%s %s: %.3f с, запросов к БД: %s (%.3f с). '
+                'Частые запросы: %s',
+                request.method, request.path, duration, metrics.queries,
+                metrics.query_time,
+                '; '.join(f'{count} x {sql}' for sql, count
+                          in metrics.fingerprints.most_common(5)))
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
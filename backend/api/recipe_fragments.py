@@ -0,0 +1,52 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .response_cache import catalog_keys, generation_key, get_generations
+
+KEY_PREFIX = 'recipe_fragment'
+USER_FIELDS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def get_fragment_keys(recipes, origin):
+    dependencies = catalog_keys()
+    for recipe in recipes:
+        dependencies.append(generation_key(f'recipe:{recipe.id}'))
+        dependencies.append(generation_key(f'user:{recipe.author_id}'))
+    generations = get_generations(dependencies)
+    catalogs = ':'.join(str(generations[key]) for key in catalog_keys())
+    keys = {}
+    for recipe in recipes:
+        version = ':'.join(map(str, (
+            origin, catalogs, recipe.updated_at.isoformat(),
+            generations[generation_key(f'recipe:{recipe.id}')],
+            generations[generation_key(f'user:{recipe.author_id}')],
+        )))
+        digest = hashlib.md5(version.encode()).hexdigest()
+        keys[recipe.id] = f'{KEY_PREFIX}:{recipe.id}:{digest}'
+    return keys, generations
+
+
+def get_fragments(keys):
+    cached = cache.get_many(list(keys.values()))
+    return {recipe_id: cached[key] for recipe_id, key in keys.items()
+            if key in cached}
+
+
+def store_fragment(key, data):
+    fragment = {name: value for name, value in data.items()
+                if name not in USER_FIELDS}
+    fragment['author'] = {name: value
+                          for name, value in data['author'].items()
+                          if name != 'is_subscribed'}
+    cache.set(key, fragment, settings.RECIPE_FRAGMENT_TIMEOUT)
+
+
+def merge_fragment(fragment, is_subscribed, is_favorited,
+                   is_in_shopping_cart):
+    data = dict(fragment)
+    data['author'] = dict(fragment['author'], is_subscribed=is_subscribed)
+    data['is_favorited'] = is_favorited
+    data['is_in_shopping_cart'] = is_in_shopping_cart
+    return data
@@ -0,0 +1,148 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from recipes.catalog import ingredient_catalog, tag_catalog
+
+KEY_PREFIX = 'anon_cache'
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Vary')
+NORMALIZED_PARAMS = ('page', 'limit', 'tags', 'tags_mode', 'author',
+                     'pagination', 'cursor', 'search')
+
+
+def generation_key(name):
+    return f'{KEY_PREFIX}:gen:{name}'
+
+
+def catalog_keys():
+    return [tag_catalog.version_key, ingredient_catalog.version_key]
+
+
+def get_generations(keys):
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, time.time_ns(), None)
+            generations[key] = cache.get(key)
+    return generations
+
+
+def bump(*names):
+    # Поколение хранит время изменения: по нему строится Last-Modified
+    # ответов, зависящих от автора и справочников.
+    now = time.time_ns()
+    cache.set_many({generation_key(name): now for name in names}, None)
+
+
+def bump_on_commit(*names):
+    transaction.on_commit(lambda: bump(*names))
+
+
+def count(event):
+    key = f'{KEY_PREFIX}:{event}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def get_stats():
+    stats = cache.get_many([f'{KEY_PREFIX}:hits', f'{KEY_PREFIX}:misses'])
+    return {'hits': stats.get(f'{KEY_PREFIX}:hits', 0),
+            'misses': stats.get(f'{KEY_PREFIX}:misses', 0)}
+
+
+def get_cache_key(request, default_limit):
+    params = request.query_params
+    normalized = {
+        'page': params.get('page', '1'),
+        'limit': params.get('limit', str(default_limit)),
+        'tags': ','.join(sorted(set(params.getlist('tags')))),
+    }
+    for name in NORMALIZED_PARAMS:
+        normalized.setdefault(name, params.get(name, ''))
+    raw = '&'.join(f'{name}={normalized[name]}'
+                   for name in NORMALIZED_PARAMS)
+    digest = hashlib.md5(
+        f'{request.get_host()}{request.path}?{raw}'.encode()).hexdigest()
+    return f'{KEY_PREFIX}:response:{digest}'
+
+
+def list_dependencies(params):
+    names = []
+    slugs = set(params.getlist('tags'))
+    author = params.get('author')
+    if slugs:
+        names += [f'tag:{tag.id}' for tag in tag_catalog.all()
+                  if tag.slug in slugs]
+    if author:
+        names.append(f'user:{author}')
+    if not slugs and not author:
+        names.append('recipes')
+    return catalog_keys() + [generation_key(name) for name in names]
+
+
+def detail_dependencies(recipe_id):
+    return catalog_keys() + [generation_key(f'recipe:{recipe_id}')]
+
+
+def get_cached_response(key):
+    entry = cache.get(key)
+    if entry is not None:
+        dependencies = entry['dependencies']
+        if get_generations(list(dependencies)) == dependencies:
+            count('hits')
+            response = HttpResponse(entry['content'],
+                                    content_type=entry['content_type'])
+            for header, value in entry['headers'].items():
+                response[header] = value
+            return response
+    count('misses')
+    return None
+
+
+def store_response(key, response, generations):
+    entry = {
+        'content': response.rendered_content,
+        'content_type': response['Content-Type'],
+        'headers': {header: response[header] for header in CACHED_HEADERS
+                    if response.has_header(header)},
+        'dependencies': generations,
+    }
+    cache.set(key, entry, settings.ANONYMOUS_CACHE_TIMEOUT)
+
+
+def recipe_saved(sender, instance, **kwargs):
+    bump_on_commit('recipes', f'recipe:{instance.id}',
+                   f'user:{instance.author_id}')
+
+
+def recipe_deleted(sender, instance, **kwargs):
+    tag_ids = instance.tags.values_list('id', flat=True)
+    bump_on_commit('recipes', f'recipe:{instance.id}',
+                   f'user:{instance.author_id}',
+                   *(f'tag:{tag_id}' for tag_id in tag_ids))
+
+
+def recipe_tags_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        recipe_ids = pk_set or instance.recipe_set.values_list(
+            'id', flat=True)
+        names = [f'tag:{instance.id}']
+        names += [f'recipe:{recipe_id}' for recipe_id in recipe_ids]
+    else:
+        tag_ids = pk_set or instance.tags.values_list('id', flat=True)
+        names = [f'recipe:{instance.id}']
+        names += [f'tag:{tag_id}' for tag_id in tag_ids]
+    bump_on_commit(*names)
+
+
+def user_saved(sender, instance, **kwargs):
+    bump_on_commit(f'user:{instance.id}')
@@ -0,0 +1,137 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Case, F, IntegerField, Value, When
+
+from recipes.catalog import ingredient_catalog
+from recipes.models import Ingredient, Recipe
+from .response_cache import generation_key, get_generations
+
+WORD_RE = re.compile(r'\w+')
+RECIPE_FIELD_WEIGHTS = (('name', 2), ('text', 1))
+
+
+class IngredientSearchIndex:
+    def __init__(self):
+        self._version = None
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def get_entries(self):
+        version = ingredient_catalog.refresh()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._entries = sorted(
+                        (ingredient.name.lower(), ingredient.pk)
+                        for ingredient in ingredient_catalog.all())
+                    self._version = version
+        return self._entries
+
+    def search(self, query, limit):
+        query = query.lower()
+        entries = self.get_entries()
+        ids = []
+        position = bisect_left(entries, (query,))
+        while (position < len(entries) and len(ids) < limit
+               and entries[position][0].startswith(query)):
+            ids.append(entries[position][1])
+            position += 1
+        for name, pk in entries:
+            if len(ids) >= limit:
+                break
+            if query in name and not name.startswith(query):
+                ids.append(pk)
+        return ids
+
+
+ingredient_index = IngredientSearchIndex()
+
+
+def search_ingredients(query, limit=None):
+    limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+    if connection.vendor == 'postgresql':
+        return list(Ingredient.objects.filter(
+            name__icontains=query
+        ).annotate(
+            is_substring=Case(When(name__istartswith=query, then=Value(0)),
+                              default=Value(1),
+                              output_field=IntegerField())
+        ).order_by('is_substring', 'name')[:limit])
+    ids = ingredient_index.search(query, limit)
+    ingredients = ingredient_catalog.in_bulk(ids)
+    return [ingredients[pk] for pk in ids if pk in ingredients]
+
+
+class RecipeSearchIndex:
+    def __init__(self):
+        self._version = None
+        self._postings = {}
+        self._tokens = []
+        self._lock = threading.Lock()
+
+    def build(self):
+        postings = defaultdict(lambda: defaultdict(int))
+        fields = [field for field, _ in RECIPE_FIELD_WEIGHTS]
+        for recipe in Recipe.objects.values('id', *fields).iterator():
+            for field, weight in RECIPE_FIELD_WEIGHTS:
+                for token in WORD_RE.findall(recipe[field].lower()):
+                    postings[token][recipe['id']] += weight
+        return {token: dict(scores) for token, scores in postings.items()}
+
+    def get_postings(self):
+        key = generation_key('recipes')
+        version = get_generations([key])[key]
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._postings = self.build()
+                    self._tokens = sorted(self._postings)
+                    self._version = version
+        return self._postings, self._tokens
+
+    def search(self, query):
+        postings, tokens = self.get_postings()
+        scores = None
+        for term in WORD_RE.findall(query.lower()):
+            matched = defaultdict(int)
+            position = bisect_left(tokens, term)
+            while (position < len(tokens)
+                   and tokens[position].startswith(term)):
+                for recipe_id, score in postings[tokens[position]].items():
+                    matched[recipe_id] += score
+                position += 1
+            if scores is None:
+                scores = matched
+            else:
+                scores = {recipe_id: score + matched[recipe_id]
+                          for recipe_id, score in scores.items()
+                          if recipe_id in matched}
+        if not scores:
+            return []
+        return sorted(scores, key=lambda recipe_id: (-scores[recipe_id],
+                                                     -recipe_id))
+
+
+recipe_index = RecipeSearchIndex()
+
+
+def search_recipes(queryset, query):
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query,
+                                   config=settings.RECIPE_SEARCH_CONFIG)
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-rank', '-pub_date', '-id')
+    ids = recipe_index.search(query)
+    if not ids:
+        return queryset.none()
+    return queryset.filter(id__in=ids).order_by(Case(
+        *[When(id=recipe_id, then=Value(position))
+          for position, recipe_id in enumerate(ids)],
+        output_field=IntegerField()))
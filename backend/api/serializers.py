@@ -1,15 +1,21 @@
-import base64
+import binascii
+from collections import Counter
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer
 from django.contrib.auth import get_user_model
+from django.conf import settings
 from django.contrib.auth import authenticate
-from django.core.files.base import ContentFile
-from django.db import transaction
+from django.db import IntegrityError, models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
 
+from recipes.catalog import ingredient_catalog
+from recipes.counters import change_recipe_counter
 from recipes.models import User, Tag, Ingredient
 from recipes.models import Recipe, RecipeIngredient, Favorite, ShoppingCart
+from recipes.user_recipes import favorite_ids, shopping_cart_ids
 from users.models import Subscriptions
+from . import images, recipe_fragments
 
 
 class CreateUserSerializer(UserCreateSerializer):
@@ -46,7 +52,46 @@ class CreateUserSerializer(UserCreateSerializer):
         return attrs
 
 
+class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'too_large': 'Размер изображения превышает {max_size} байт.',
+        'invalid_base64': 'Изображение должно быть строкой base64.',
+    }
+
+    def __init__(self, *args, variant=None, **kwargs):
+        self.variant = variant
+        super().__init__(*args, **kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) and data.startswith('data:image'):
+            data = self.decode(data)
+        return super().to_internal_value(data)
+
+    def decode(self, data):
+        format, _, imgstr = data.partition(';base64,')
+        ext = format.split('/')[-1]
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        try:
+            return images.decode_base64(imgstr, 'temp.' + ext, max_size)
+        except images.ImageTooLarge:
+            self.fail('too_large', max_size=max_size)
+        except binascii.Error:
+            self.fail('invalid_base64')
+
+    def to_representation(self, value):
+        if value and self.variant:
+            url = images.get_variant_url(value, self.variant)
+            if url is not None:
+                request = self.context.get('request')
+                if request is not None:
+                    return request.build_absolute_uri(url)
+                return url
+        return super().to_representation(value)
+
+
 class LimitedRecipeSerializer(serializers.ModelSerializer):
+    image = Base64ImageField(read_only=True, variant='thumbnail')
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -60,6 +105,8 @@ class UserDisplaySerializer(CreateUserSerializer):
                   'last_name', 'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request and request.user.id:
             user = request.user
@@ -85,11 +132,16 @@ class UserSubscripeSerializer(UserDisplaySerializer):
                   'last_name', 'is_subscribed', 'recipes', 'recipes_count')
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
         subscribed_user = obj
         recipe_count = Recipe.objects.filter(author=subscribed_user).count()
         return recipe_count
 
     def get_recipes(self, obj):
+        if hasattr(obj, 'limited_recipes'):
+            return LimitedRecipeSerializer(obj.limited_recipes,
+                                           many=True).data
         recipes_limit = self.context.get(
             'request').query_params.get('recipes_limit')
         if recipes_limit:
@@ -132,13 +184,16 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Ошибка! Нельзя подписаться на себя')
 
-        if Subscriptions.objects.filter(
-           user=user, subscriber=subscriber).exists():
+        return validated_data
+
+    def create(self, validated_data):
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
             raise serializers.ValidationError(
                 'Ошибка! Нельзя подписаться на автора два раза')
 
-        return validated_data
-
     def get_recipes(self):
         user = self.context['request'].user
         recipes = Recipe.objects.filter(user=user)
@@ -155,17 +210,6 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'color', 'slug']
 
 
-class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-
-        return super().to_internal_value(data)
-
-
 class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ingredient
@@ -183,9 +227,18 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'amount', 'measurement_unit']
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        recipes = list(data)
+        self.child.load_fragments(recipes)
+        return [self.child.to_representation(recipe) for recipe in recipes]
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     author = UserDisplaySerializer(read_only=True)
-    image = Base64ImageField(required=False, allow_null=True)
+    image = Base64ImageField(required=False, allow_null=True, variant='card')
     ingredients = serializers.SerializerMethodField()
     tags = TagSerializer(many=True, read_only=True)
     name = serializers.CharField(max_length=254)
@@ -198,29 +251,75 @@ class RecipeSerializer(serializers.ModelSerializer):
         fields = ['id', 'author', 'image', 'ingredients', 'tags', 'name',
                   'text', 'cooking_time', 'is_favorited',
                   'is_in_shopping_cart']
+        list_serializer_class = RecipeListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fragment_keys = {}
+        self.fragments = {}
+        self.generations = {}
+
+    def get_prefetches(self):
+        # Автор загружается вместе с тегами и ингредиентами: после
+        # снимка поколений, чтобы переименование не попало во фрагмент
+        # под новым поколением со старыми данными.
+        return (
+            'author',
+            'tags',
+            Prefetch('recipeingredient_set',
+                     queryset=RecipeIngredient.objects.select_related(
+                         'ingredient')),
+        )
+
+    def load_fragments(self, recipes):
+        request = self.context.get('request')
+        origin = (f'{request.scheme}://{request.get_host()}'
+                  if request else '')
+        keys, generations = recipe_fragments.get_fragment_keys(
+            recipes, origin)
+        self.fragment_keys.update(keys)
+        self.generations.update(generations)
+        self.fragments.update(recipe_fragments.get_fragments(keys))
+        missing = [recipe for recipe in recipes
+                   if recipe.id not in self.fragments]
+        if missing:
+            prefetch_related_objects(missing, *self.get_prefetches())
+
+    def get_author_is_subscribed(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            return instance.author_is_subscribed
+        return self.fields['author'].get_is_subscribed(instance.author_id)
+
+    def to_representation(self, instance):
+        if instance.id not in self.fragment_keys:
+            self.load_fragments([instance])
+        fragment = self.fragments.get(instance.id)
+        if fragment is not None:
+            return recipe_fragments.merge_fragment(
+                fragment,
+                self.get_author_is_subscribed(instance),
+                self.get_is_favorited(instance),
+                self.get_is_in_shopping_cart(instance))
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        data = super().to_representation(instance)
+        recipe_fragments.store_fragment(self.fragment_keys[instance.id], data)
+        return data
 
     def get_ingredients(self, obj):
-        recipe_ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        recipe_ingredients = obj.recipeingredient_set.all()
         return RecipeIngredientSerializer(recipe_ingredients, many=True).data
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         if request and request.user.id:
-            user = request.user
-            recipe = obj
-            is_favorited = Favorite.objects.filter(
-                user=user, recipe=recipe).exists()
-            return is_favorited
+            return obj.id in favorite_ids.get(request)
         return False
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         if request and request.user.id:
-            user = request.user
-            recipe = obj
-            is_in_cart = ShoppingCart.objects.filter(
-                user=user, recipe=recipe).exists()
-            return is_in_cart
+            return obj.id in shopping_cart_ids.get(request)
         return False
 
     def validate_request_data(self, request):
@@ -238,64 +337,110 @@ class RecipeSerializer(serializers.ModelSerializer):
     @transaction.atomic
     def create(self, validated_data):
         self.validate_request_data(self.context['request'])
+        ingredients = self.resolve_ingredients(
+            self.context['request'].data.get('ingredients'))
         recipe = Recipe.objects.create(**validated_data)
+        if recipe.image:
+            images.schedule_variants(recipe.image.name)
         recipe.tags.set(self.context['request'].data.get('tags'))
-        ingredients = self.context['request'].data.get('ingredients')
-        self.create_recipe_ingredients(recipe, ingredients)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=amount)
+            for ingredient, amount in ingredients.values()
+        )
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
+        ingredients = self.resolve_ingredients(
+            self.context['request'].data.get('ingredients'))
         super().update(instance, validated_data)
+        if validated_data.get('image'):
+            images.schedule_variants(instance.image.name)
         instance.tags.set(self.context['request'].data.get('tags'))
-        ingredients = self.context['request'].data.get('ingredients')
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        self.create_recipe_ingredients(instance, ingredients)
-        instance.save()
+        self.update_recipe_ingredients(instance, ingredients)
         return instance
 
-    def create_recipe_ingredients(self, recipe, ingredients):
-        recipe_ingredients = [
-            RecipeIngredient(
-                recipe=recipe,
-                ingredient=get_object_or_404(Ingredient,
-                                             id=ingredient_data['id']),
-                amount=ingredient_data['amount']
-            )
-            for ingredient_data in ingredients
-        ]
-        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+    def resolve_ingredients(self, ingredients_data):
+        ids = [int(ingredient_data['id'])
+               for ingredient_data in ingredients_data]
+        found = ingredient_catalog.in_bulk(ids)
+        errors = []
+        duplicates = sorted(
+            pk for pk, count in Counter(ids).items() if count > 1)
+        if duplicates:
+            errors.append(f'Ингридиенты повторяются: {duplicates}')
+        missing = sorted(set(ids) - set(found))
+        if missing:
+            errors.append(f'Ингридиенты не найдены: {missing}')
+        if errors:
+            raise serializers.ValidationError({'ingredients': errors})
+        return {
+            int(ingredient_data['id']): (
+                found[int(ingredient_data['id'])],
+                int(ingredient_data['amount']))
+            for ingredient_data in ingredients_data
+        }
+
+    def update_recipe_ingredients(self, recipe, ingredients):
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipeingredient_set.all()
+        }
+        to_delete = [recipe_ingredient.id
+                     for ingredient_id, recipe_ingredient in existing.items()
+                     if ingredient_id not in ingredients]
+        to_update = []
+        to_create = []
+        for ingredient_id, (ingredient, amount) in ingredients.items():
+            recipe_ingredient = existing.get(ingredient_id)
+            if recipe_ingredient is None:
+                to_create.append(RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=amount))
+            elif recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+        if to_delete:
+            RecipeIngredient.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+
+
+class UserRecipeSerializer(serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    recipe = serializers.IntegerField(source='recipe_id')
+    duplicate_message = None
+    counter = None
 
+    def create(self, validated_data):
+        # UPDATE счётчика заодно проверяет, что рецепт существует, и
+        # блокирует его строку до коммита: иначе отложенная проверка
+        # внешнего ключа упала бы только при COMMIT.
+        if not change_recipe_counter(validated_data['recipe_id'],
+                                     self.counter, 1):
+            raise serializers.ValidationError({'recipe': 'Рецепт не найден'})
+        try:
+            with transaction.atomic():
+                return super().create(validated_data)
+        except IntegrityError:
+            raise serializers.ValidationError(self.duplicate_message)
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(read_only=True)
-    recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all())
+
+class FavoriteSerializer(UserRecipeSerializer):
+    duplicate_message = 'Этот рецепт уже в избранном!'
+    counter = 'favorites_count'
 
     class Meta:
         model = Favorite
         fields = ('user', 'recipe')
 
-    def validate(self, data):
-        user = self.context['request'].user
-        recipe = data['recipe']
-        if Favorite.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError(
-                'Этот рецепт уже в избранном!')
-        return data
-
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    user = serializers.PrimaryKeyRelatedField(read_only=True)
-    recipe = serializers.PrimaryKeyRelatedField(queryset=Recipe.objects.all())
+class ShoppingCartSerializer(UserRecipeSerializer):
+    duplicate_message = 'Этот рецепт уже в корзине!'
+    counter = 'in_carts_count'
 
     class Meta:
         model = ShoppingCart
         fields = ('user', 'recipe')
-
-    def validate(self, data):
-        user = self.context['request'].user
-        recipe = data['recipe']
-        if ShoppingCart.objects.filter(user=user, recipe=recipe).exists():
-            raise serializers.ValidationError(
-                'Этот рецепт уже в корзине!')
-        return data
@@ -0,0 +1,113 @@
+import csv
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from recipes.models import RecipeIngredient
+
+logger = logging.getLogger(__name__)
+
+TITLE = 'Список покупок:'
+FOOTER = 'Хорошего дня!'
+PDF_CACHE_PREFIX = 'shopping_cart_pdf'
+PDF_FAILED = 'failed'
+PDF_RETRY_AFTER = 1
+
+pdf_executor = ThreadPoolExecutor(
+    max_workers=settings.SHOPPING_LIST_PDF_WORKERS,
+    thread_name_prefix='shopping-list-pdf')
+
+
+class PdfUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Не удалось сформировать PDF, попробуйте позже'
+    default_code = 'pdf_unavailable'
+
+
+def get_shopping_list(user):
+    return RecipeIngredient.objects.filter(
+        recipe__shopping_cart_users__user=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        total_amount=Sum('amount')
+    ).order_by('ingredient__name')
+
+
+def txt_lines(ingredients):
+    yield f'{TITLE}\n\n'
+    for item in ingredients:
+        yield (f'{item["ingredient__name"]} - {item["total_amount"]} '
+               f'{item["ingredient__measurement_unit"]}\n')
+    yield f'\n\n{FOOTER}'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['Название', 'Количество', 'Единицы измерения'])
+    for item in ingredients:
+        yield writer.writerow([item['ingredient__name'],
+                               item['total_amount'],
+                               item['ingredient__measurement_unit']])
+
+
+def render_pdf(ingredients):
+    from weasyprint import HTML
+
+    rows = ''.join(
+        f'<li>{escape(item["ingredient__name"])} - {item["total_amount"]} '
+        f'{escape(item["ingredient__measurement_unit"])}</li>'
+        for item in ingredients)
+    html = (f'<html><head><meta charset="utf-8"></head><body>'
+            f'<h1>{TITLE}</h1><ul>{rows}</ul><p>{FOOTER}</p></body></html>')
+    return HTML(string=html).write_pdf()
+
+
+def render_to_cache(key, ingredients):
+    try:
+        pdf = render_pdf(ingredients)
+    except Exception:
+        logger.exception('Не удалось сформировать PDF %s', key)
+        cache.set(f'{key}:status', PDF_FAILED,
+                  settings.SHOPPING_LIST_PDF_TIMEOUT)
+        return
+    cache.set(key, pdf, settings.SHOPPING_LIST_PDF_CACHE_TIMEOUT)
+    cache.delete(f'{key}:status')
+
+
+def get_pdf(user, ingredients):
+    # Возвращает готовый PDF или None, если он ещё формируется: запрос
+    # не ждёт воркер, клиент повторяет его после Retry-After.
+    ingredients = list(ingredients)
+    # Версия корзины - хэш агрегированного списка покупок.
+    version = hashlib.sha1(repr(ingredients).encode()).hexdigest()
+    key = f'{PDF_CACHE_PREFIX}:{user.id}:{version}'
+    pdf = cache.get(key)
+    if pdf is not None:
+        return pdf
+    status_key = f'{key}:status'
+    if cache.add(status_key, time.time(),
+                 settings.SHOPPING_LIST_PDF_TIMEOUT * 2):
+        pdf_executor.submit(render_to_cache, key, ingredients)
+        return None
+    started = cache.get(status_key)
+    if started == PDF_FAILED or (
+            started is not None
+            and time.time() - started > settings.SHOPPING_LIST_PDF_TIMEOUT):
+        # Следующий запрос запустит формирование заново.
+        cache.delete(status_key)
+        raise PdfUnavailable
+    return cache.get(key)
@@ -0,0 +1,579 @@
+import io
+import itertools
+import json
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from recipes import timeline
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag, TimelineEntry, User)
+from users.models import Profile, Subscriptions
+from . import metrics, recipe_fragments, response_cache, shopping_list
+from .authentication import get_cache_key
+from .serializers import RecipeListSerializer, TagSerializer
+from .views import RecipeViewSet
+
+
+class RecipeDataMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            'reader', 'reader@example.com', 'password',
+            first_name='Читатель', last_name='Читатель')
+        cls.author = User.objects.create_user(
+            'author', 'author@example.com', 'password',
+            first_name='Автор', last_name='Автор')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {index}', color='#ffffff',
+                               slug=f'tag-{index}')
+            for index in range(3)]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {index}',
+                                      measurement_unit='г')
+            for index in range(5)]
+        cls.recipes = []
+        for index in range(15):
+            recipe = Recipe.objects.create(
+                author=(cls.author, cls.user)[index % 2],
+                name=f'Рецепт {index}', text='Текст', cooking_time=10)
+            recipe.tags.set(cls.tags[:index % 3 + 1])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=index + 1)
+                for ingredient in cls.ingredients[:3])
+            if index % 3 == 0:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+            cls.recipes.append(recipe)
+        Subscriptions.objects.create(user=cls.user, subscriber=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+
+class RecipeListQueriesTest(RecipeDataMixin, APITestCase):
+    def get_recipes(self, limit):
+        cache.clear()
+        response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return response
+
+    def assert_constant_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get_recipes(2)
+        for limit in (6, 12):
+            with self.assertNumQueries(len(context)):
+                self.get_recipes(limit)
+
+    def test_anonymous_queries_do_not_depend_on_limit(self):
+        self.assert_constant_queries()
+
+    def test_authenticated_queries_do_not_depend_on_limit(self):
+        self.client.force_authenticate(self.user)
+        self.assert_constant_queries()
+
+
+class SubscriptionsQueriesTest(RecipeDataMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def get_subscriptions(self, recipes_limit):
+        cache.clear()
+        response = self.client.get('/api/users/subscriptions/',
+                                   {'recipes_limit': recipes_limit})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_queries_do_not_depend_on_authors_or_recipes_limit(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get_subscriptions(1)
+        for index in range(4):
+            author = User.objects.create_user(
+                f'author{index}', f'author{index}@example.com', 'password')
+            Recipe.objects.bulk_create(
+                Recipe(author=author, name=f'Рецепт {number}',
+                       text='Текст', cooking_time=10)
+                for number in range(3))
+            Subscriptions.objects.create(user=self.user, subscriber=author)
+        for recipes_limit in (1, 3):
+            with self.assertNumQueries(len(context)):
+                response = self.get_subscriptions(recipes_limit)
+            self.assertEqual(len(response.data['results']), 5)
+            self.assertEqual(
+                len(response.data['results'][1]['recipes']), recipes_limit)
+
+
+class KeysetPaginationTest(RecipeDataMixin, APITestCase):
+    def get_page(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_pages_recipes_with_same_pub_date(self):
+        Recipe.objects.update(pub_date=self.recipes[0].pub_date)
+        page = self.get_page('/api/recipes/',
+                             {'pagination': 'cursor', 'limit': 4})
+        ids = [recipe['id'] for recipe in page['results']]
+        while page['next']:
+            page = self.get_page(page['next'])
+            ids += [recipe['id'] for recipe in page['results']]
+        self.assertEqual(ids, sorted(
+            (recipe.id for recipe in self.recipes), reverse=True))
+
+    def test_invalid_cursor_returns_404(self):
+        for cursor in ('не курсор', 'bm90LWEtY3Vyc29y'):
+            response = self.client.get('/api/recipes/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+
+class RecipeTagsFilterTest(RecipeDataMixin, APITestCase):
+    def get_ids(self, params):
+        response = self.client.get('/api/recipes/', {'limit': 20, **params})
+        self.assertEqual(response.status_code, 200)
+        return {recipe['id']
+                for recipe in json.loads(response.content)['results']}
+
+    def test_any_tag_by_default(self):
+        self.assertEqual(self.get_ids({'tags': ['tag-0', 'tag-2']}),
+                         {recipe.id for recipe in self.recipes})
+
+    def test_all_tags(self):
+        self.assertEqual(
+            self.get_ids({'tags': ['tag-0', 'tag-2'], 'tags_mode': 'all'}),
+            {recipe.id for recipe in self.recipes[2::3]})
+
+    def test_all_tags_with_unknown_slug(self):
+        self.assertEqual(
+            self.get_ids({'tags': ['tag-0', 'unknown'], 'tags_mode': 'all'}),
+            set())
+
+
+class RecipeIngredientsUpdateTest(RecipeDataMixin, APITestCase):
+    def get_row_ids(self, recipe):
+        return dict(RecipeIngredient.objects.filter(
+            recipe=recipe).values_list('ingredient_id', 'id'))
+
+    def test_update_diffs_ingredients(self):
+        recipe = self.recipes[0]
+        before = self.get_row_ids(recipe)
+        changed, kept, removed = self.ingredients[:3]
+        added = self.ingredients[3]
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            {'ingredients': [{'id': changed.id, 'amount': 5},
+                             {'id': kept.id, 'amount': 1},
+                             {'id': added.id, 'amount': 7}],
+             'tags': [self.tags[0].id]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(RecipeIngredient.objects.filter(recipe=recipe).values_list(
+                'ingredient_id', 'amount')),
+            {changed.id: 5, kept.id: 1, added.id: 7})
+        after = self.get_row_ids(recipe)
+        self.assertEqual(after[changed.id], before[changed.id])
+        self.assertEqual(after[kept.id], before[kept.id])
+        self.assertNotIn(removed.id, after)
+
+
+class RecipeSearchTest(RecipeDataMixin, APITestCase):
+    def test_name_matches_rank_first(self):
+        in_text = Recipe.objects.create(
+            author=self.author, name='Суп', text='Настоящий борщ',
+            cooking_time=10)
+        in_name = Recipe.objects.create(
+            author=self.author, name='Борщ', text='Текст', cooking_time=10)
+        response = self.client.get('/api/recipes/', {'search': 'борщ'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id']
+             for recipe in json.loads(response.content)['results']],
+            [in_name.id, in_text.id])
+
+
+class RecipeConditionalGetTest(RecipeDataMixin, APITestCase):
+    def assert_modified_after(self, change):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def rename_author(self):
+        self.recipes[0].author.first_name = 'Новое имя'
+        self.recipes[0].author.save()
+
+    def rename_tag(self):
+        self.tags[0].name = 'Новый тег'
+        self.tags[0].save()
+
+    def test_image_variants_change_etag(self):
+        self.assert_modified_after(
+            lambda: response_cache.bump(f'recipe:{self.recipes[0].id}'))
+
+    def test_recipe_change_during_read_keeps_old_etag(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        get_object = RecipeViewSet.get_object
+
+        def change_during_read(view):
+            response_cache.bump(f'recipe:{self.recipes[0].id}')
+            return get_object(view)
+        with mock.patch.object(RecipeViewSet, 'get_object',
+                               change_during_read):
+            etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_author_rename_changes_etag(self):
+        self.assert_modified_after(self.rename_author)
+
+    def test_tag_rename_changes_etag(self):
+        self.assert_modified_after(self.rename_tag)
+
+    def test_authenticated_tag_rename_changes_etag(self):
+        self.client.force_authenticate(self.user)
+        self.assert_modified_after(self.rename_tag)
+
+
+class AnonymousResponseCacheTest(RecipeDataMixin, APITestCase):
+    def assert_refreshed(self, url, change, read):
+        before = read(self.client.get(url))
+        self.assertEqual(read(self.client.get(url)), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertNotEqual(read(self.client.get(url)), before)
+
+    def get_first(self, response):
+        return json.loads(response.content)['results'][0]
+
+    def test_recipe_edit_refreshes_list(self):
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+
+        def change():
+            recipe.name = 'Новое название'
+            recipe.save()
+        self.assert_refreshed(
+            '/api/recipes/', change,
+            lambda response: self.get_first(response)['name'])
+
+    def test_tag_change_refreshes_tag_filtered_list(self):
+        recipe = Recipe.objects.filter(tags=self.tags[2]).order_by(
+            '-pub_date', '-id').first()
+        self.assert_refreshed(
+            f'/api/recipes/?tags={self.tags[2].slug}',
+            lambda: recipe.tags.remove(self.tags[2]),
+            lambda response: self.get_first(response)['id'])
+
+    def test_author_rename_refreshes_detail(self):
+        recipe = self.recipes[0]
+
+        def change():
+            recipe.author.first_name = 'Новое имя'
+            recipe.author.save()
+        self.assert_refreshed(
+            f'/api/recipes/{recipe.id}/', change,
+            lambda response: json.loads(
+                response.content)['author']['first_name'])
+
+    def test_change_during_build_is_not_cached(self):
+        to_representation = RecipeListSerializer.to_representation
+
+        def change_during_build(serializer, data):
+            response_cache.bump('recipes')
+            return to_representation(serializer, data)
+        with mock.patch.object(RecipeListSerializer, 'to_representation',
+                               change_during_build):
+            self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/')
+        self.assertEqual(response_cache.get_stats()['hits'], 0)
+
+    def test_repeated_request_is_served_from_cache(self):
+        self.client.get('/api/recipes/')
+        with self.assertNumQueries(0):
+            self.client.get('/api/recipes/')
+
+
+class ShoppingListPdfTest(RecipeDataMixin, APITestCase):
+    url = '/api/recipes/download_shopping_cart/?format=pdf'
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+
+    def run_now(self, function, *args):
+        function(*args)
+
+    @mock.patch.object(shopping_list, 'render_pdf', return_value=b'%PDF')
+    def test_pdf_is_rendered_in_background(self, render_pdf):
+        with mock.patch.object(shopping_list.pdf_executor, 'submit') as submit:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertIn('Retry-After', response)
+        submit.assert_called_once()
+        self.run_now(*submit.call_args.args)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'%PDF')
+
+    @mock.patch.object(shopping_list, 'render_pdf', side_effect=OSError)
+    def test_failed_render_returns_503(self, render_pdf):
+        with mock.patch.object(shopping_list.pdf_executor, 'submit',
+                               side_effect=self.run_now), \
+                self.assertLogs('api.shopping_list', 'ERROR'):
+            self.assertEqual(self.client.get(self.url).status_code, 202)
+            self.assertEqual(self.client.get(self.url).status_code, 503)
+            self.assertEqual(self.client.get(self.url).status_code, 202)
+
+
+class FeedTest(RecipeDataMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        timeline.fill(Subscriptions.objects.all())
+        self.client.force_authenticate(self.user)
+        self.expected = list(Recipe.objects.filter(
+            author=self.author).order_by('-pub_date', '-id').values_list(
+            'id', flat=True))
+
+    def get_ids(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def assert_feed(self):
+        self.assertEqual(self.get_ids('/api/recipes/feed/?limit=3'),
+                         self.expected)
+        self.assertEqual(
+            self.get_ids('/api/recipes/feed/?limit=3&pagination=cursor'),
+            self.expected)
+
+    def test_feed_from_timeline(self):
+        self.assert_feed()
+
+    def test_feed_with_pulled_author(self):
+        Profile.objects.filter(user=self.author).update(
+            followers_count=settings.TIMELINE_FANOUT_LIMIT + 1)
+        self.assert_feed()
+        TimelineEntry.objects.all().delete()
+        self.assert_feed()
+
+    def test_recipe_created_outside_api_reaches_feed(self):
+        recipe = Recipe.objects.create(author=self.author, name='Новый',
+                                       text='Текст', cooking_time=5)
+        self.assertEqual(self.get_ids('/api/recipes/feed/?limit=3')[0],
+                         recipe.id)
+
+    def test_author_back_under_limit_is_fanned_out(self):
+        follower = User.objects.create_user(
+            'follower', 'follower@example.com', 'password')
+        Subscriptions.objects.create(user=follower, subscriber=self.author)
+        Profile.objects.filter(user=self.author).update(
+            followers_count=settings.TIMELINE_FANOUT_LIMIT + 1)
+        recipe = Recipe.objects.create(author=self.author, name='Новый',
+                                       text='Текст', cooking_time=5)
+        self.expected.insert(0, recipe.id)
+        self.client.force_authenticate(follower)
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(response.status_code, 204)
+        self.client.force_authenticate(self.user)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, recipe=recipe).exists())
+        self.assert_feed()
+
+
+class OuterSerializer(serializers.Serializer):
+    inner = serializers.SerializerMethodField()
+
+    def get_inner(self, obj):
+        return TagSerializer(obj).data
+
+
+class MetricsTest(RecipeDataMixin, APITestCase):
+    def test_nested_serializers_are_timed_once(self):
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_metrics.set(request_metrics)
+        try:
+            with mock.patch.object(metrics.time, 'perf_counter',
+                                   side_effect=itertools.count()):
+                OuterSerializer(self.tags[0]).data
+        finally:
+            metrics.current_metrics.reset(token)
+        self.assertEqual(request_metrics.serializer_time, 1)
+
+    def test_streaming_response_queries_are_recorded(self):
+        self.client.force_authenticate(self.user)
+        labels = ('GET', '/api/recipes/download_shopping_cart/')
+        queries = metrics.registry.queries[labels]
+        count, total = queries.count, queries.sum
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(queries.count, count)
+        b''.join(response.streaming_content)
+        self.assertEqual(queries.count, count + 1)
+        self.assertGreater(queries.sum, total)
+
+
+class CachedTokenAuthenticationTest(RecipeDataMixin, APITestCase):
+    url = '/api/users/me/'
+
+    def setUp(self):
+        super().setUp()
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_cached_token_skips_token_query(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertFalse(any('authtoken_token' in query['sql']
+                             for query in context.captured_queries))
+
+    def test_logout_revokes_cached_token(self):
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deactivation_revokes_cached_token(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_password_change_refreshes_cached_user(self):
+        response = self.client.post(
+            '/api/users/set_password/',
+            {'current_password': 'password', 'new_password': 'Nw-pass-42'})
+        self.assertEqual(response.status_code, 204)
+        self.assertIsNone(cache.get(get_cache_key(self.token.key)))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Nw-pass-42'))
+
+    def test_password_hash_is_not_cached(self):
+        self.assertNotIn(self.user.password,
+                         cache.get(get_cache_key(self.token.key)))
+
+    def test_user_cached_before_commit_is_dropped(self):
+        key = get_cache_key(self.token.key)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+            cache.set(key, ['устаревший пользователь'])
+        self.assertIsNone(cache.get(key))
+
+
+class RecipeFragmentTest(RecipeDataMixin, APITestCase):
+    def get_recipe(self, user, recipe):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/recipes/', {'limit': 15})
+        return next(data for data in json.loads(response.content)['results']
+                    if data['id'] == recipe.id)
+
+    def test_user_fields_are_not_shared(self):
+        recipe = self.recipes[0]
+        data = self.get_recipe(self.user, recipe)
+        self.assertTrue(data['is_favorited'])
+        self.assertTrue(data['author']['is_subscribed'])
+        data = self.get_recipe(self.author, recipe)
+        self.assertFalse(data['is_favorited'])
+        self.assertFalse(data['is_in_shopping_cart'])
+        self.assertFalse(data['author']['is_subscribed'])
+
+    def test_changes_refresh_fragment(self):
+        recipe = self.recipes[0]
+        self.get_recipe(self.user, recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.author.first_name = 'Новое имя'
+            recipe.author.save()
+            recipe.tags.set(self.tags[1:])
+        data = self.get_recipe(self.user, recipe)
+        self.assertEqual(data['author']['first_name'], 'Новое имя')
+        self.assertEqual({tag['id'] for tag in data['tags']},
+                         {tag.id for tag in self.tags[1:]})
+
+    def test_rename_during_build_is_not_cached(self):
+        recipe = self.recipes[0]
+        get_fragment_keys = recipe_fragments.get_fragment_keys
+
+        def rename_during_build(recipes, origin):
+            User.objects.filter(id=recipe.author_id).update(
+                first_name='Новое имя')
+            response_cache.bump(f'user:{recipe.author_id}')
+            return get_fragment_keys(recipes, origin)
+        with mock.patch.object(recipe_fragments, 'get_fragment_keys',
+                               rename_during_build):
+            self.get_recipe(self.user, recipe)
+        for user in (self.user, None):
+            data = self.get_recipe(user, recipe)
+            self.assertEqual(data['author']['first_name'], 'Новое имя')
+
+
+class CountersTest(RecipeDataMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.recipe = self.recipes[1]
+
+    def get_count(self):
+        self.recipe.refresh_from_db()
+        return self.recipe.favorites_count
+
+    def test_favorite_updates_counter(self):
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.get_count(), 1)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.get_count(), 1)
+        self.assertTrue(self.get_recipe_flag('is_favorited'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.get_count(), 0)
+        self.assertFalse(self.get_recipe_flag('is_favorited'))
+
+    def get_recipe_flag(self, name):
+        return self.client.get(f'/api/recipes/{self.recipe.id}/').data[name]
+
+    def test_favorite_uses_update_and_insert_only(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(
+                f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        statements = [query['sql'].split()[0] for query
+                      in context.captured_queries]
+        self.assertEqual(
+            [statement for statement in statements if statement not in (
+                'BEGIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')],
+            ['UPDATE', 'INSERT'])
+
+    def test_missing_recipe_returns_400(self):
+        response = self.client.post('/api/recipes/0/shopping_cart/')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ShoppingCart.objects.filter(recipe_id=0).exists())
+
+    def test_recompute_counters_repairs_drift(self):
+        Recipe.objects.update(favorites_count=42, in_carts_count=42)
+        call_command('recompute_counters', stdout=io.StringIO())
+        self.assertEqual(self.get_count(), 0)
+        favorited = self.recipes[0]
+        favorited.refresh_from_db()
+        self.assertEqual(favorited.favorites_count, 1)
+        self.assertEqual(favorited.in_carts_count, 1)
+        profile = Profile.objects.get(user=self.author)
+        self.assertEqual(profile.followers_count, 1)
+        self.assertEqual(profile.recipes_count, 8)
@@ -1,5 +1,8 @@
 from djoser.views import UserViewSet
 
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.db.models import prefetch_related_objects
 from django.shortcuts import get_object_or_404
 
 from rest_framework.authtoken.views import ObtainAuthToken
@@ -17,7 +20,9 @@ from .serializers import SubscriptionsSerializer
 from .paginations import CustomPagination
 from .permissions import IsPostOrReadOnly
 
-from recipes.models import User
+from recipes import timeline
+from recipes.counters import change_profile_counter
+from recipes.models import Recipe, User
 from users.models import Subscriptions
 
 
@@ -94,29 +99,55 @@ class SubscriptionsViewSet(ModelViewSet):
             data={'subscriber': subscriber_id},
             context={'request': request})
         serializer.is_valid(raise_exception=True)
-        serializer.save(user=request.user)
+        with transaction.atomic():
+            serializer.save(user=request.user)
+            change_profile_counter(subscriber.id, 'followers_count', 1)
+            timeline.backfill(request.user.id, subscriber.id)
         users = [subscriber]
         user_serializer = UserSubscripeSerializer(users, many=True,
                                                   context={'request': request})
         return Response(user_serializer.data, status=status.HTTP_201_CREATED)
 
     def list(self, request):
-        queryset = self.get_queryset()
+        queryset = self.get_queryset().select_related(
+            'subscriber__profile').order_by('id')
         page = self.paginate_queryset(queryset)
         if page is not None:
-            users = [subscription.subscriber for subscription in page]
+            users = self.get_subscribers(page)
             serializer = UserSubscripeSerializer(users, many=True,
                                                  context={'request': request})
             return self.get_paginated_response(serializer.data)
-        users = [subscription.subscriber for subscription in queryset]
+        users = self.get_subscribers(queryset)
         serializer = UserSubscripeSerializer(users, many=True,
                                              context={'request': request})
         return Response(serializer.data)
 
+    def get_subscribers(self, subscriptions):
+        users = []
+        for subscription in subscriptions:
+            subscriber = subscription.subscriber
+            subscriber.recipes_count = subscriber.profile.recipes_count
+            subscriber.is_subscribed = True
+            users.append(subscriber)
+        recipes = Recipe.objects.all()
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit:
+            latest_recipes = Recipe.objects.filter(
+                author=OuterRef('author')).values('id')[:int(recipes_limit)]
+            recipes = recipes.filter(id__in=Subquery(latest_recipes))
+        prefetch_related_objects(
+            users, Prefetch('recipes', queryset=recipes,
+                            to_attr='limited_recipes'))
+        return users
+
     def destroy(self, request, user_id=None):
         subscriber_id = user_id
         subscriber = get_object_or_404(User, id=subscriber_id)
         subscription = get_object_or_404(Subscriptions, user=request.user,
                                          subscriber=subscriber)
-        subscription.delete()
+        with transaction.atomic():
+            subscription.delete()
+            change_profile_counter(subscriber.id, 'followers_count', -1)
+            timeline.remove(request.user.id, subscriber.id)
+            timeline.resume_fan_out(subscriber.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
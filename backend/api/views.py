@@ -1,54 +1,215 @@
+import hashlib
+
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
 
 
+from recipes.catalog import ingredient_catalog, tag_catalog
+from recipes.counters import change_profile_counter, change_recipe_counter
 from recipes.models import Tag, Ingredient
 from recipes.models import Recipe, Favorite, ShoppingCart
+from recipes import timeline
+from recipes.user_recipes import favorite_ids, shopping_cart_ids
+from users.models import Subscriptions
 from .serializers import TagSerializer
 from .serializers import RecipeSerializer, IngredientSerializer
 from .serializers import FavoriteSerializer
 from .serializers import ShoppingCartSerializer
 from .permissions import IsOwnerOrReadOnly
 from .permissions import IsAdminUserOrReadOnly
-from .paginations import CustomPagination
+from .paginations import FeedPagination, RecipePagination
 from .filters import RecipeFilter
+from .search import search_ingredients
+from .shopping_list import get_shopping_list, get_pdf, txt_lines, csv_lines
+from .shopping_list import PDF_RETRY_AFTER
+from . import response_cache
+
 
+class CatalogConditionalMixin:
+    catalog = None
+
+    def list(self, request, *args, **kwargs):
+        etag = quote_etag(f'{self.catalog.model._meta.model_name}-'
+                          f'{self.catalog.refresh()}')
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified['ETag'] = etag
+            return not_modified
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
 
-class TagViewSet(ModelViewSet):
+
+class TagViewSet(CatalogConditionalMixin, ModelViewSet):
+    catalog = tag_catalog
     serializer_class = TagSerializer
     permission_classes = [IsAdminUserOrReadOnly]
 
     def get_queryset(self):
+        if self.action == 'list':
+            return tag_catalog.all()
         queryset = Tag.objects.all()
         return queryset
 
 
-class IngridientViewSet(ModelViewSet):
+class IngridientViewSet(CatalogConditionalMixin, ModelViewSet):
+    catalog = ingredient_catalog
     serializer_class = IngredientSerializer
     permission_classes = [IsAdminUserOrReadOnly]
 
     def get_queryset(self):
         queryset = Ingredient.objects.all()
         name = self.request.query_params.get('name', None)
-        if name:
-            queryset = queryset.filter(name__icontains=name)
+        if self.action == 'list':
+            if name:
+                return search_ingredients(name)
+            return ingredient_catalog.all()
         return queryset
 
 
 class RecipeViewSet(ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    pagination_class = CustomPagination
+    pagination_class = RecipePagination
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
     permission_classes = [IsOwnerOrReadOnly | IsAdminUserOrReadOnly]
 
+    def get_queryset(self):
+        queryset = Recipe.objects.defer('search_vector')
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                author_is_subscribed=Exists(Subscriptions.objects.filter(
+                    user=user, subscriber=OuterRef('author'))))
+        return queryset
+
+    def get_generations(self, recipe, generations):
+        # Поколения справочников и рецепта снимаются до get_object(),
+        # автора - до загрузки его строки в сериализаторе.
+        author_key = response_cache.generation_key(
+            f'user:{recipe.author_id}')
+        generations = {**response_cache.get_generations([author_key]),
+                       **generations}
+        return [generations[key] for key in sorted(generations)]
+
+    def get_etag(self, recipe, generations):
+        request = self.request
+        parts = [recipe.id, recipe.updated_at.isoformat(), *generations]
+        if request.user.is_authenticated:
+            parts += [request.user.id,
+                      recipe.id in favorite_ids.get(request),
+                      recipe.id in shopping_cart_ids.get(request),
+                      recipe.author_is_subscribed]
+        validator = ':'.join(map(str, parts))
+        return quote_etag(hashlib.md5(validator.encode()).hexdigest())
+
+    def is_cacheable(self, request):
+        return (not request.user.is_authenticated
+                and request.accepted_renderer.format == 'json')
+
+    def render(self, response):
+        response.accepted_renderer = self.request.accepted_renderer
+        response.accepted_media_type = self.request.accepted_media_type
+        response.renderer_context = self.get_renderer_context()
+        return response.render()
+
+    def list(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().list(request, *args, **kwargs)
+        key = response_cache.get_cache_key(request,
+                                           self.paginator.page_size)
+        response = response_cache.get_cached_response(key)
+        if response is not None:
+            return response
+        # Поколения читаются до запроса к БД: изменение, закоммиченное
+        # во время сборки ответа, не попадёт в кэш под новой версией.
+        generations = response_cache.get_generations(
+            response_cache.list_dependencies(request.query_params))
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            self.render(response)
+            serializer = response.data['results'].serializer.child
+            response_cache.store_response(
+                key, response, {**serializer.generations, **generations})
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return self.retrieve_instance(request)
+        key = response_cache.get_cache_key(request,
+                                           self.paginator.page_size)
+        response = response_cache.get_cached_response(key)
+        if response is not None:
+            return get_conditional_response(
+                request, etag=response['ETag'],
+                last_modified=parse_http_date_safe(
+                    response['Last-Modified']),
+                response=response)
+        generations = response_cache.get_generations(
+            response_cache.detail_dependencies(kwargs[self.lookup_field]))
+        response = self.retrieve_instance(request, generations)
+        if response.status_code == status.HTTP_200_OK:
+            self.render(response)
+            serializer = response.data.serializer
+            response_cache.store_response(
+                key, response, {**serializer.generations, **generations})
+        return response
+
+    def retrieve_instance(self, request, generations=None):
+        if generations is None:
+            generations = response_cache.get_generations(
+                response_cache.detail_dependencies(
+                    self.kwargs[self.lookup_field]))
+        instance = self.get_object()
+        generations = self.get_generations(instance, generations)
+        etag = self.get_etag(instance, generations)
+        last_modified = None
+        if not request.user.is_authenticated:
+            last_modified = max(int(instance.updated_at.timestamp()),
+                                *(value // 10 ** 9 for value in generations))
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if not_modified is None:
+            response = Response(self.get_serializer(instance).data)
+        else:
+            response = not_modified
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            pagination_class=FeedPagination)
+    def feed(self, request):
+        feed = timeline.get_feed(
+            self.filter_queryset(self.get_queryset()), request.user)
+        page = self.paginate_queryset(feed)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        change_profile_counter(self.request.user.id, 'recipes_count', 1)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        instance.delete()
+        change_profile_counter(instance.author_id, 'recipes_count', -1)
 
 
 class FavoriteViewSet(ModelViewSet):
@@ -57,8 +218,10 @@ class FavoriteViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
     lookup_field = 'recipe_id'
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        instance = serializer.save(user=self.request.user)
+        favorite_ids.invalidate(instance.user_id)
 
     def create(self, request, recipe_id=None):
         serializer = self.serializer_class(data={'recipe': recipe_id},
@@ -69,8 +232,14 @@ class FavoriteViewSet(ModelViewSet):
 
     def destroy(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        queryset.filter(user=request.user,
-                        recipe_id=self.kwargs['recipe_id']).delete()
+        with transaction.atomic():
+            deleted, _ = queryset.filter(
+                user=request.user,
+                recipe_id=self.kwargs['recipe_id']).delete()
+            if deleted:
+                change_recipe_counter(self.kwargs['recipe_id'],
+                                      'favorites_count', -1)
+                favorite_ids.invalidate(request.user.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -80,8 +249,10 @@ class ShoppingCartViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
     lookup_field = 'recipe_id'
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        instance = serializer.save(user=self.request.user)
+        shopping_cart_ids.invalidate(instance.user_id)
 
     def create(self, request, recipe_id=None):
         serializer = self.serializer_class(data={'recipe': recipe_id},
@@ -92,32 +263,56 @@ class ShoppingCartViewSet(ModelViewSet):
 
     def destroy(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
-        queryset.filter(user=request.user,
-                        recipe_id=self.kwargs['recipe_id']).delete()
+        with transaction.atomic():
+            deleted, _ = queryset.filter(
+                user=request.user,
+                recipe_id=self.kwargs['recipe_id']).delete()
+            if deleted:
+                change_recipe_counter(self.kwargs['recipe_id'],
+                                      'in_carts_count', -1)
+                shopping_cart_ids.invalidate(request.user.id)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
+
+
 class DownloadShoppingCartViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
+    content_negotiation_class = IgnoreFormatContentNegotiation
 
     def download(self, request):
-        shopping_cart = ShoppingCart.objects.filter(user=request.user)
-        ingredients = {}
-
-        for item in shopping_cart:
-            for recipe_ingredient in item.recipe.recipeingredient_set.all():
-                ingredient = recipe_ingredient.ingredient
-                if ingredient.name in ingredients:
-                    ingredients[ingredient.name] += recipe_ingredient.amount
-                else:
-                    ingredients[ingredient.name] = recipe_ingredient.amount
-
-        content = ''
-        for name, amount in ingredients.items():
-            content += f'{name} - {amount} г\n'
-        content_total = f'Список покупок:\n\n{content}\n\nХорошего дня!'
-        response = HttpResponse(content_total, content_type='text/plain')
-        response['Content-Disposition'] = ('attachment;'
-                                           'filename="shopping_cart.txt"')
+        file_format = request.query_params.get('format', 'txt')
+        ingredients = get_shopping_list(request.user)
+        if file_format == 'txt':
+            response = StreamingHttpResponse(
+                txt_lines(ingredients.iterator()), content_type='text/plain')
+        elif file_format == 'csv':
+            response = StreamingHttpResponse(
+                csv_lines(ingredients.iterator()), content_type='text/csv')
+        elif file_format == 'pdf':
+            pdf = get_pdf(request.user, ingredients)
+            if pdf is None:
+                return Response(
+                    {'detail': 'Список покупок формируется, '
+                               'повторите запрос позже'},
+                    status=status.HTTP_202_ACCEPTED,
+                    headers={'Retry-After': str(PDF_RETRY_AFTER)})
+            response = HttpResponse(pdf, content_type='application/pdf')
+        else:
+            raise ValidationError(
+                {'format': 'Допустимые форматы: txt, csv, pdf'})
+        response['Content-Disposition'] = (
+            'attachment;'
+            f'filename="shopping_cart.{file_format}"')
 
         return response
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(response_cache.get_stats())
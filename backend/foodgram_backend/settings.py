@@ -6,7 +6,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv('DJANGO_KEY', 1234)
 
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', '1234568').split()
 
@@ -28,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -69,6 +70,21 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+if CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    # Фрагменты рецептов быстро заполняют стандартные 300 записей, а
+    # вытеснение ключей поколений сбрасывает все кэши.
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+    }
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -107,9 +123,37 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 }
 
+AUTH_TOKEN_CACHE_TIMEOUT = 60
+
+USER_RECIPE_IDS_TIMEOUT = 60 * 10
+
+ANONYMOUS_CACHE_TIMEOUT = 60 * 5
+
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60
+
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+RECIPE_SEARCH_CONFIG = 'russian'
+
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', 10000))
+TIMELINE_BATCH_SIZE = 1000
+
+METRICS_LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+METRICS_QUERY_BUDGET = int(os.getenv('METRICS_QUERY_BUDGET', 20))
+METRICS_LATENCY_BUDGET = float(os.getenv('METRICS_LATENCY_BUDGET', 0.5))
+
+SHOPPING_LIST_PDF_WORKERS = int(os.getenv('SHOPPING_LIST_PDF_WORKERS', 2))
+SHOPPING_LIST_PDF_TIMEOUT = int(os.getenv('SHOPPING_LIST_PDF_TIMEOUT', 30))
+SHOPPING_LIST_PDF_CACHE_TIMEOUT = 60 * 60
+
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE',
+                                      5 * 1024 * 1024))
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_SIZE * 4 // 3 + 1024 * 1024
+IMAGE_VARIANT_WORKERS = int(os.getenv('IMAGE_VARIANT_WORKERS', 2))
+IMAGE_VARIANT_QUALITY = 80
+
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
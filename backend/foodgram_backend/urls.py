@@ -4,8 +4,9 @@ from rest_framework import routers
 from api.views import TagViewSet
 from api.views import IngridientViewSet, RecipeViewSet
 from api.views import FavoriteViewSet, ShoppingCartViewSet
-from api.views import DownloadShoppingCartViewSet
+from api.views import DownloadShoppingCartViewSet, ResponseCacheStatsView
 from api.users_views import UsersView, Logout, CustomAuthToken
+from api.metrics import metrics_view
 from api.users_views import SubscriptionsViewSet
 
 
@@ -20,6 +21,7 @@ router.register(r'recipes', RecipeViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('users/me/', UsersView.as_view, name='me'),
     path('api/auth/token/login/', CustomAuthToken.as_view()),
     path('api/auth/token/logout/', Logout.as_view()),
@@ -35,5 +37,7 @@ urlpatterns = [
     path('api/recipes/download_shopping_cart/',
          DownloadShoppingCartViewSet.as_view(
              {'get': 'download'}), name='download_shopping_cart'),
+    path('api/cache/stats/', ResponseCacheStatsView.as_view(),
+         name='response_cache_stats'),
     path('api/', include(router.urls))
 ]
@@ -1,11 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as DefaultUserAdmin
 from django.contrib.auth.models import User
-from django.db.models import Count
 
 from .models import Tag, Ingredient, Recipe, Favorite
 from .models import RecipeIngredient, RecipeTag, ShoppingCart
-from users.models import Subscriptions
+from users.models import Profile, Subscriptions
 
 admin.site.unregister(User)
 
@@ -22,15 +21,7 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author',)
     list_filter = ('author', 'name', 'tags')
     search_fields = ('name',)
-    readonly_fields = ('favorite_count',)
-
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        return qs.annotate(favorite_count=Count('users_who_favorited'))
-
-    def favorite_count(self, obj):
-        return obj.favorite_count
-    favorite_count.short_description = 'Число добавлений в избранное'
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
 
 @admin.register(Ingredient)
@@ -41,6 +32,7 @@ class IngredientAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Subscriptions)
+admin.site.register(Profile)
 admin.site.register(Tag)
 admin.site.register(Favorite)
 admin.site.register(RecipeIngredient)
@@ -4,3 +4,29 @@ from django.apps import AppConfig
 class RecipesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipes'
+
+    def ready(self):
+        from django.db.models.signals import (post_delete, post_save,
+                                              pre_save)
+
+        from . import timeline
+        from .catalog import ingredient_catalog, tag_catalog
+        from .models import Ingredient, Recipe, Tag
+        from .signals import (release_deleted_image, release_replaced_image,
+                              update_search_vector)
+
+        for model, catalog in ((Tag, tag_catalog),
+                               (Ingredient, ingredient_catalog)):
+            post_save.connect(catalog.invalidate, sender=model,
+                              dispatch_uid=f'{model.__name__}_catalog_save')
+            post_delete.connect(
+                catalog.invalidate, sender=model,
+                dispatch_uid=f'{model.__name__}_catalog_delete')
+        pre_save.connect(release_replaced_image, sender=Recipe,
+                         dispatch_uid='recipe_release_replaced_image')
+        post_delete.connect(release_deleted_image, sender=Recipe,
+                            dispatch_uid='recipe_release_deleted_image')
+        post_save.connect(update_search_vector, sender=Recipe,
+                          dispatch_uid='recipe_update_search_vector')
+        post_save.connect(timeline.recipe_created, sender=Recipe,
+                          dispatch_uid='recipe_timeline_fan_out')
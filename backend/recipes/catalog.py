@@ -0,0 +1,71 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import router
+
+from .models import Ingredient, Tag
+
+CATALOG_TIMEOUT = 60 * 60 * 24
+
+
+class Catalog:
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = fields
+        self.key_prefix = f'catalog:{model._meta.label_lower}'
+        self._version = None
+        self._items = []
+        self._items_by_id = {}
+        self._lock = threading.Lock()
+
+    @property
+    def version_key(self):
+        return f'{self.key_prefix}:version'
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            cache.add(self.version_key, time.time_ns(), None)
+            version = cache.get(self.version_key)
+        return version
+
+    def invalidate(self, **kwargs):
+        cache.set(self.version_key, time.time_ns(), None)
+
+    def load(self, version):
+        data_key = f'{self.key_prefix}:{version}'
+        rows = cache.get(data_key)
+        if rows is None:
+            rows = list(self.model.objects.values_list(*self.fields))
+            cache.set(data_key, rows, CATALOG_TIMEOUT)
+        db = router.db_for_read(self.model)
+        return [self.model.from_db(db, self.fields, row) for row in rows]
+
+    def refresh(self):
+        version = self.get_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    items = self.load(version)
+                    self._items_by_id = {item.pk: item for item in items}
+                    self._items = items
+                    self._version = version
+        return version
+
+    def all(self):
+        self.refresh()
+        return self._items
+
+    def get(self, pk):
+        self.refresh()
+        return self._items_by_id.get(int(pk))
+
+    def in_bulk(self, ids):
+        self.refresh()
+        items = self._items_by_id
+        return {pk: items[pk] for pk in map(int, ids) if pk in items}
+
+
+tag_catalog = Catalog(Tag, ('id', 'name', 'color', 'slug'))
+ingredient_catalog = Catalog(Ingredient, ('id', 'name', 'measurement_unit'))
@@ -0,0 +1,36 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Profile, Subscriptions
+from .models import Favorite, Recipe, ShoppingCart
+
+
+def change_counter(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_recipe_counter(recipe_id, field, delta):
+    return change_counter(Recipe.objects.filter(id=recipe_id), field, delta)
+
+
+def change_profile_counter(user_id, field, delta):
+    return change_counter(Profile.objects.filter(user_id=user_id), field,
+                          delta)
+
+
+def count_subquery(model, field, outer_field='pk'):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef(outer_field)}).order_by(
+        ).values(field).annotate(count=Count('id')).values('count')), 0)
+
+
+RECIPE_COUNTERS = {
+    'favorites_count': (Favorite, 'recipe'),
+    'in_carts_count': (ShoppingCart, 'recipe'),
+}
+PROFILE_COUNTERS = {
+    'recipes_count': (Recipe, 'author'),
+    'followers_count': (Subscriptions, 'subscriber'),
+}
@@ -1,24 +1,99 @@
-import pandas as pd
+import csv
+import json
 import os
+import time
+from itertools import islice
 
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 from django.conf import settings
+from django.db import transaction
+from recipes.catalog import ingredient_catalog
 from recipes.models import Ingredient
 
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов')
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError('Некорректный JSON-файл')
+            chunk = file.read(READ_SIZE)
+            eof = not chunk
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
 
 class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=os.path.join(settings.BASE_DIR, 'data',
+                                 'ingredients.csv'))
+        parser.add_argument('--batch-size', type=int, default=1000)
+
     def handle(self, *args, **options):
-        csv_file = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
-        data = pd.read_csv(csv_file,
-                           header=None,
-                           names=['name', 'measurement_unit'])
-        row_iter = data.iterrows()
-        ingredients = [
-            Ingredient(
-                id=index + 1,
-                name=row["name"],
-                measurement_unit=row["measurement_unit"],
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только .csv и .json файлы')
+        started = time.monotonic()
+        inserted = skipped = 0
+        with open(path, encoding='utf-8') as file:
+            rows = (
+                (name.strip(), measurement_unit.strip())
+                for name, measurement_unit in reader(file)
             )
-            for index, row in row_iter
-        ]
-        Ingredient.objects.bulk_create(ingredients,)
+            while True:
+                batch = list(islice(rows, options['batch_size']))
+                if not batch:
+                    break
+                batch_inserted = self.load_batch(batch)
+                inserted += batch_inserted
+                skipped += len(batch) - batch_inserted
+        if inserted:
+            ingredient_catalog.invalidate()
+        self.stdout.write(
+            f'Добавлено: {inserted}, пропущено: {skipped}, '
+            f'время: {time.monotonic() - started:.2f} с')
+
+    @transaction.atomic
+    def load_batch(self, batch):
+        seen = set(Ingredient.objects.filter(
+            name__in={name for name, _ in batch}
+        ).values_list('name', 'measurement_unit'))
+        new = []
+        for key in batch:
+            if key in seen:
+                continue
+            seen.add(key)
+            new.append(Ingredient(name=key[0], measurement_unit=key[1]))
+        Ingredient.objects.bulk_create(new)
+        return len(new)
@@ -0,0 +1,172 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, ShoppingCart, Tag, User
+from users.models import Subscriptions
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет основные эндпоинты API и выводит p50/p95/p99 '
+            'задержки и число запросов к БД')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--base-url',
+                            help='Адрес запущенного сервера вместо '
+                                 'тестового клиента')
+        parser.add_argument('--username',
+                            help='Пользователь для авторизованных запросов')
+        parser.add_argument('--output', help='Сохранить результаты в JSON')
+        parser.add_argument('--compare',
+                            help='JSON с прошлыми результатами')
+        parser.add_argument('--tolerance', type=float, default=20,
+                            help='Допустимый рост p95 в процентах')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 2:
+            raise CommandError('--requests: нужно не меньше двух запросов '
+                               'для расчёта перцентилей')
+        user = self.get_user(options['username'])
+        token, _ = Token.objects.get_or_create(user=user)
+        results = {}
+        with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for name, url, authenticated in self.get_scenarios(user):
+                headers = ({'HTTP_AUTHORIZATION': f'Token {token.key}'}
+                           if authenticated else {})
+                results[name] = self.measure(url, headers, options)
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            self.compare(results, options['compare'], options['tolerance'])
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'Пользователь {username} не найден')
+            return user
+        user_id = ShoppingCart.objects.values_list(
+            'user_id', flat=True).first()
+        if user_id is None:
+            user_id = Subscriptions.objects.values_list(
+                'user_id', flat=True).first()
+        user = User.objects.filter(id=user_id).first() or User.objects.first()
+        if user is None:
+            raise CommandError('Нет пользователей: запустите generate_data')
+        return user
+
+    def get_scenarios(self, user):
+        tag = Tag.objects.first()
+        author_id = Recipe.objects.values_list('author_id', flat=True).first()
+        ingredient = Ingredient.objects.first()
+        scenarios = [
+            ('recipes (аноним)', '/api/recipes/', False),
+            ('recipes', '/api/recipes/', True),
+            ('recipes page 10', '/api/recipes/?page=10', True),
+            ('recipes cursor', '/api/recipes/?pagination=cursor', True),
+            ('recipes is_favorited', '/api/recipes/?is_favorited=1', True),
+            ('recipes is_in_shopping_cart',
+             '/api/recipes/?is_in_shopping_cart=1', True),
+            ('recipes feed', '/api/recipes/feed/', True),
+            ('subscriptions',
+             '/api/users/subscriptions/?recipes_limit=3', True),
+            ('download_shopping_cart',
+             '/api/recipes/download_shopping_cart/', True),
+        ]
+        if tag is not None:
+            scenarios.append(
+                ('recipes tags', f'/api/recipes/?tags={tag.slug}', True))
+        if author_id is not None:
+            scenarios.append(
+                ('recipes author', f'/api/recipes/?author={author_id}',
+                 True))
+        if ingredient is not None:
+            prefix = ingredient.name[:3]
+            scenarios.append(
+                ('ingredients search', f'/api/ingredients/?name={prefix}',
+                 False))
+            scenarios.append(
+                ('recipes search', f'/api/recipes/?search={prefix}', True))
+        return scenarios
+
+    def request(self, client, url, headers):
+        if isinstance(client, Client):
+            response = client.get(url, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response.status_code
+        headers = {'Authorization': headers['HTTP_AUTHORIZATION']
+                   } if headers else {}
+        return client.get(self.base_url + url, headers=headers).status_code
+
+    def measure(self, url, headers, options):
+        if options['base_url']:
+            import requests
+
+            client = requests.Session()
+            self.base_url = options['base_url'].rstrip('/')
+        else:
+            client = Client()
+        for _ in range(options['warmup']):
+            self.request(client, url, headers)
+        latencies = []
+        queries = []
+        for _ in range(options['requests']):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                status = self.request(client, url, headers)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+            if status >= 400:
+                raise CommandError(f'{url}: ответ {status}')
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        result = {'url': url, 'p50': cuts[49], 'p95': cuts[94],
+                  'p99': cuts[98]}
+        if not options['base_url']:
+            result['queries'] = statistics.mean(queries)
+        return result
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"Сценарий":<30} {"p50, мс":>9} {"p95, мс":>9} '
+            f'{"p99, мс":>9} {"запросов":>9}')
+        for name, result in results.items():
+            queries = result.get('queries')
+            queries = '-' if queries is None else f'{queries:.1f}'
+            self.stdout.write(
+                f'{name:<30} {result["p50"]:9.1f} {result["p95"]:9.1f} '
+                f'{result["p99"]:9.1f} {queries:>9}')
+
+    def compare(self, results, path, tolerance):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = []
+        for name, result in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if result['p95'] > previous['p95'] * (1 + tolerance / 100):
+                regressions.append(
+                    f'{name}: p95 {previous["p95"]:.1f} -> '
+                    f'{result["p95"]:.1f} мс')
+            if 'queries' not in result or 'queries' not in previous:
+                continue
+            if result['queries'] > previous['queries']:
+                regressions.append(
+                    f'{name}: запросов {previous["queries"]:.1f} -> '
+                    f'{result["queries"]:.1f}')
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write('Регрессий не найдено')
@@ -0,0 +1,127 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+# Выполняется в отдельном интерпретаторе, чтобы замерить холодный старт
+# так же, как его видит воркер gunicorn.
+CHILD_SCRIPT = '''
+import io
+import json
+import sys
+import time
+
+started = time.perf_counter()
+from foodgram_backend.wsgi import application
+loaded = time.perf_counter()
+path, host = sys.argv[1], sys.argv[2]
+environ = {
+    'REQUEST_METHOD': 'GET',
+    'PATH_INFO': path,
+    'QUERY_STRING': '',
+    'SERVER_NAME': host,
+    'SERVER_PORT': '80',
+    'HTTP_HOST': host,
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': 'http',
+    'wsgi.input': io.BytesIO(),
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': False,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+}
+statuses = []
+response = application(
+    environ, lambda status, headers, exc_info=None: statuses.append(status))
+b''.join(response)
+response.close()
+finished = time.perf_counter()
+print(json.dumps({
+    'load': loaded - started,
+    'first_response': finished - started,
+    'status': statuses[0],
+}))
+'''
+
+
+def parse_import_times(output):
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_time, _, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(self_time)
+    return times
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время импорта приложений и время до первого ответа '
+            'WSGI-приложения')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/tags/')
+        parser.add_argument('--host')
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--top', type=int, default=10)
+
+    def handle(self, *args, **options):
+        host = options['host'] or self.get_host()
+        runs = [self.run_child(options['path'], host)
+                for _ in range(options['runs'])]
+        loads = [result['load'] for result, _ in runs]
+        responses = [result['first_response'] for result, _ in runs]
+        self.stdout.write(f'Ответ: {runs[0][0]["status"]}')
+        self.stdout.write(
+            f'Загрузка foodgram_backend.wsgi: '
+            f'{statistics.median(loads) * 1000:.0f} мс')
+        self.stdout.write(
+            f'Время до первого ответа: '
+            f'{statistics.median(responses) * 1000:.0f} мс')
+        by_app, by_package = self.group(
+            [import_times for _, import_times in runs])
+        self.stdout.write('Импорт по приложениям:')
+        for name, spent in sorted(by_app.items(), key=lambda item: -item[1]):
+            self.stdout.write(f'  {name:<40} {spent / 1000:8.1f} мс')
+        self.stdout.write('Самые тяжёлые пакеты:')
+        packages = sorted(by_package.items(), key=lambda item: -item[1])
+        for name, spent in packages[:options['top']]:
+            self.stdout.write(f'  {name:<40} {spent / 1000:8.1f} мс')
+
+    def get_host(self):
+        for host in settings.ALLOWED_HOSTS:
+            if not host.startswith('.') and host != '*':
+                return host
+        return 'localhost'
+
+    def run_child(self, path, host):
+        env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD_SCRIPT,
+             path, host],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if process.returncode:
+            raise CommandError(process.stderr[-2000:])
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        return result, parse_import_times(process.stderr)
+
+    def group(self, runs):
+        app_modules = sorted(
+            (config.name for config in apps.get_app_configs()),
+            key=len, reverse=True)
+        by_app = defaultdict(int)
+        by_package = defaultdict(int)
+        for import_times in runs:
+            for module, spent in import_times.items():
+                by_package[module.split('.')[0]] += spent / len(runs)
+                for app_module in app_modules:
+                    if (module == app_module
+                            or module.startswith(app_module + '.')):
+                        by_app[app_module] += spent / len(runs)
+                        break
+        return by_app, by_package
@@ -0,0 +1,146 @@
+import random
+import time
+import uuid
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db.models import Max
+
+from recipes import timeline
+from recipes.catalog import tag_catalog
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag, User)
+from recipes.signals import update_search_vectors
+from users.models import Subscriptions
+
+DEFAULT_PASSWORD = 'foodgram-load-test'
+
+
+class Command(BaseCommand):
+    help = 'Генерирует синтетические данные для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Избранных рецептов на пользователя')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Рецептов в корзине на пользователя')
+        parser.add_argument('--subscriptions', type=int, default=10,
+                            help='Подписок на пользователя')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        ingredients = list(Ingredient.objects.values_list('id', 'name'))
+        if not ingredients:
+            raise CommandError('Сначала загрузите ингредиенты: '
+                               'python manage.py bd_load_data')
+        started = time.monotonic()
+        prefix = uuid.uuid4().hex[:8]
+        last_subscription_id = self.get_last_id(Subscriptions)
+        last_recipe_id = self.get_last_id(Recipe)
+
+        user_ids = self.create_users(options['users'], prefix)
+        tag_ids = self.create_tags(options['tags'], prefix)
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, prefix,
+            [name for _, name in ingredients])
+        ingredient_ids = [pk for pk, _ in ingredients]
+        created = {
+            'пользователей': len(user_ids),
+            'тегов': len(tag_ids),
+            'рецептов': len(recipe_ids),
+            'тегов рецептов': self.link(
+                RecipeTag, recipe_ids, 'recipe_id', tag_ids, 'tag_id',
+                lambda: self.random.randint(1, min(3, len(tag_ids)))),
+            'ингредиентов рецептов': self.link(
+                RecipeIngredient, recipe_ids, 'recipe_id', ingredient_ids,
+                'ingredient_id', lambda: options['ingredients_per_recipe'],
+                amount=lambda: self.random.randint(1, 500)),
+            'избранного': self.link(
+                Favorite, user_ids, 'user_id', recipe_ids, 'recipe_id',
+                lambda: options['favorites']),
+            'корзин': self.link(
+                ShoppingCart, user_ids, 'user_id', recipe_ids, 'recipe_id',
+                lambda: options['carts']),
+            'подписок': self.link(
+                Subscriptions, user_ids, 'user_id', user_ids,
+                'subscriber_id', lambda: options['subscriptions']),
+        }
+
+        call_command('recompute_counters', batch_size=self.batch_size,
+                     stdout=self.stdout)
+        timeline.fill(
+            Subscriptions.objects.filter(id__gt=last_subscription_id))
+        update_search_vectors(Recipe.objects.filter(id__gt=last_recipe_id))
+        tag_catalog.invalidate()
+        self.stdout.write(', '.join(
+            f'{name}: {count}' for name, count in created.items()))
+        self.stdout.write(
+            f'Пароль пользователей: {DEFAULT_PASSWORD}, '
+            f'время: {time.monotonic() - started:.1f} с')
+
+    def get_last_id(self, model):
+        return model.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+
+    def insert(self, model, objects):
+        objects = iter(objects)
+        count = 0
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                return count
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+
+    def create_users(self, count, prefix):
+        last_id = self.get_last_id(User)
+        password = make_password(DEFAULT_PASSWORD)
+        self.insert(User, (
+            User(username=f'{prefix}_{index}',
+                 email=f'{prefix}_{index}@example.com',
+                 first_name='Пользователь', last_name=str(index),
+                 password=password)
+            for index in range(count)))
+        return list(User.objects.filter(id__gt=last_id).values_list(
+            'id', flat=True))
+
+    def create_tags(self, count, prefix):
+        last_id = self.get_last_id(Tag)
+        self.insert(Tag, (
+            Tag(name=f'Тег {prefix} {index}', slug=f'{prefix}-{index}',
+                color=f'#{self.random.randrange(0x1000000):06x}')
+            for index in range(count)))
+        return list(Tag.objects.filter(id__gt=last_id).values_list(
+            'id', flat=True))
+
+    def create_recipes(self, count, user_ids, prefix, words):
+        last_id = self.get_last_id(Recipe)
+        self.insert(Recipe, (
+            Recipe(author_id=self.random.choice(user_ids),
+                   name=f'{self.random.choice(words).capitalize()} '
+                        f'{prefix} {index}',
+                   text=' '.join(self.random.choices(words, k=30)),
+                   cooking_time=self.random.randint(1, 240))
+            for index in range(count)))
+        return list(Recipe.objects.filter(id__gt=last_id).values_list(
+            'id', flat=True))
+
+    def link(self, model, owner_ids, owner_field, target_ids, target_field,
+             get_count, **extra):
+        def objects():
+            for owner_id in owner_ids:
+                count = min(get_count(), len(target_ids))
+                for target_id in self.random.sample(target_ids, count):
+                    if model is Subscriptions and target_id == owner_id:
+                        continue
+                    values = {name: value() for name, value in extra.items()}
+                    yield model(**{owner_field: owner_id,
+                                   target_field: target_id}, **values)
+        return self.insert(model, objects())
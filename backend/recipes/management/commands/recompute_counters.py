@@ -0,0 +1,60 @@
+from django.core.management import BaseCommand
+from django.db.models import F
+
+from recipes.counters import (PROFILE_COUNTERS, RECIPE_COUNTERS,
+                              count_subquery)
+from recipes.models import Recipe, User
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики рецептов и профилей пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        created = self.create_missing_profiles(batch_size)
+        recipes = self.repair(Recipe.objects.all(), RECIPE_COUNTERS,
+                              'pk', batch_size)
+        profiles = self.repair(Profile.objects.all(), PROFILE_COUNTERS,
+                               'user_id', batch_size)
+        self.stdout.write(
+            f'Создано профилей: {created}, '
+            f'исправлено рецептов: {recipes}, '
+            f'исправлено профилей: {profiles}')
+
+    def batches(self, queryset, batch_size):
+        last_id = 0
+        while True:
+            batch = list(queryset.filter(id__gt=last_id).order_by(
+                'id').values_list('id', flat=True)[:batch_size])
+            if not batch:
+                return
+            yield batch
+            last_id = batch[-1]
+
+    def create_missing_profiles(self, batch_size):
+        created = 0
+        users = User.objects.filter(profile__isnull=True)
+        for batch in self.batches(users, batch_size):
+            Profile.objects.bulk_create(
+                [Profile(user_id=user_id) for user_id in batch],
+                ignore_conflicts=True)
+            created += len(batch)
+        return created
+
+    def repair(self, queryset, counters, outer_field, batch_size):
+        repaired = set()
+        for batch in self.batches(queryset, batch_size):
+            for field, (model, related_field) in counters.items():
+                actual = count_subquery(model, related_field, outer_field)
+                wrong = list(queryset.filter(id__in=batch).annotate(
+                    actual=actual
+                ).exclude(**{field: F('actual')}).values_list(
+                    'id', flat=True))
+                if wrong:
+                    queryset.filter(id__in=wrong).update(**{field: actual})
+                    repaired.update(wrong)
+        return len(repaired)
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:10
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    for model_name, fields in (('Favorite', ('user', 'recipe')),
+                               ('ShoppingCart', ('user', 'recipe')),
+                               ('RecipeTag', ('recipe', 'tag'))):
+        model = apps.get_model('recipes', model_name)
+        duplicates = model.objects.values(*fields).annotate(
+            min_id=Min('id'), count=Count('id')).filter(count__gt=1)
+        for row in duplicates:
+            model.objects.filter(
+                **{field: row[field] for field in fields}
+            ).exclude(id=row['min_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0002_ingredient_name_trgm_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates,
+                             migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date'], name='recipe_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='favorite',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_favorite'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipetag',
+            constraint=models.UniqueConstraint(fields=('recipe', 'tag'), name='unique_recipe_tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_shopping_cart'),
+        ),
+    ]
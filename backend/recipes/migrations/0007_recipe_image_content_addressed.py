@@ -0,0 +1,19 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:21
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, storage=recipes.storage.ContentAddressedStorage(), upload_to='media/', verbose_name='Изображение'),
+        ),
+    ]
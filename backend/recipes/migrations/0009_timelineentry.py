@@ -0,0 +1,60 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from itertools import islice
+
+
+def fill_timelines(apps, schema_editor):
+    Subscriptions = apps.get_model('users', 'Subscriptions')
+    TimelineEntry = apps.get_model('recipes', 'TimelineEntry')
+    rows = Subscriptions.objects.filter(
+        subscriber__recipes__isnull=False,
+        subscriber__profile__followers_count__lte=(
+            settings.TIMELINE_FANOUT_LIMIT),
+    ).values_list('user_id', 'subscriber__recipes__id',
+                  'subscriber__recipes__pub_date').iterator()
+    while True:
+        batch = list(islice(rows, settings.TIMELINE_BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                           pub_date=pub_date)
+             for user_id, recipe_id, pub_date in batch],
+            ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0008_recipe_search_vector'),
+        ('users', '0003_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи ленты',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_timeline_entry'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
+from .storage import recipe_image_storage
+
 User = get_user_model()
 
 MAX_LENGTH_NAME = 256
@@ -59,6 +62,8 @@ class Recipe(models.Model):
         verbose_name='Название')
     image = models.ImageField(
         upload_to='media/',
+        storage=recipe_image_storage,
+        db_index=True,
         null=True,
         blank=True,
         verbose_name='Изображение')
@@ -76,6 +81,18 @@ class Recipe(models.Model):
         verbose_name='Время приготовления')
     pub_date = models.DateTimeField(
         'Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField(
+        'Дата изменения', auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число добавлений в избранное')
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число добавлений в корзину')
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор')
 
     def __str__(self) -> str:
         return self.name[:15]
@@ -84,6 +101,10 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -122,6 +143,10 @@ class RecipeTag(models.Model):
     class Meta:
         verbose_name = 'Рецепт-Тэг'
         verbose_name_plural = 'Рецепты-Тэги'
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'tag'],
+                                    name='unique_recipe_tag'),
+        ]
 
 
 class Favorite(models.Model):
@@ -139,6 +164,10 @@ class Favorite(models.Model):
     class Meta:
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_favorite'),
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -156,3 +185,34 @@ class ShoppingCart(models.Model):
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзина'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_shopping_cart'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Подписчик')
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт')
+    pub_date = models.DateTimeField(
+        'Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='timeline_user_pub_date_idx'),
+        ]
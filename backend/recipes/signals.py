@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import connection, transaction
+
+from .models import Recipe
+from .storage import lock_image, recipe_image_storage
+
+
+@transaction.atomic
+def release_image(name):
+    if not name:
+        return
+    lock_image(name)
+    if not Recipe.objects.filter(image=name).exists():
+        recipe_image_storage.delete_with_variants(name)
+
+
+def release_replaced_image(sender, instance, raw=False, **kwargs):
+    if raw or instance.pk is None:
+        return
+    old_name = Recipe.objects.filter(
+        pk=instance.pk).values_list('image', flat=True).first()
+    if old_name and old_name != instance.image.name:
+        transaction.on_commit(lambda: release_image(old_name))
+
+
+def release_deleted_image(sender, instance, **kwargs):
+    name = instance.image.name
+    if name:
+        transaction.on_commit(lambda: release_image(name))
+
+
+def update_search_vectors(queryset):
+    if connection.vendor != 'postgresql':
+        return
+    config = settings.RECIPE_SEARCH_CONFIG
+    queryset.update(
+        search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config)))
+
+
+def update_search_vector(sender, instance, raw=False, **kwargs):
+    if not raw:
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
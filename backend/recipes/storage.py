@@ -0,0 +1,56 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+from django.utils.deconstruct import deconstructible
+
+IMAGE_VARIANTS = ('thumbnail', 'card')
+
+
+def lock_image(name):
+    # Блокировка до конца транзакции по имени файла. Удаление
+    # освободившегося файла ждёт коммита рецепта, который повторно
+    # использует тот же файл, и наоборот: сохранение после удаления
+    # не найдёт файл и запишет его заново.
+    if connection.vendor != 'postgresql' or not connection.in_atomic_block:
+        return
+    key = int.from_bytes(hashlib.sha256(name.encode()).digest()[:8], 'big',
+                         signed=True)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+
+
+def variant_name(name, variant):
+    root, _ = os.path.splitext(name)
+    return f'{root}_{variant}.webp'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_digest(self, content):
+        sha256 = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks():
+            sha256.update(chunk)
+        content.seek(0)
+        return sha256.hexdigest()
+
+    def save(self, name, content, max_length=None):
+        digest = self.get_digest(content)
+        dirname = posixpath.dirname(name.replace('\\', '/'))
+        ext = os.path.splitext(name)[1].lower()
+        name = posixpath.join(dirname, digest[:2], digest + ext)
+        lock_image(name)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def delete_with_variants(self, name):
+        for variant in IMAGE_VARIANTS:
+            self.delete(variant_name(name, variant))
+        self.delete(name)
+
+
+recipe_image_storage = ContentAddressedStorage()
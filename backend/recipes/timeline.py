@@ -0,0 +1,139 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+
+from users.models import Profile, Subscriptions
+from .models import Recipe, TimelineEntry
+
+
+def is_pulled(author_id):
+    return Profile.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.TIMELINE_FANOUT_LIMIT).exists()
+
+
+def create_entries(entries):
+    entries = iter(entries)
+    while True:
+        batch = list(islice(entries, settings.TIMELINE_BATCH_SIZE))
+        if not batch:
+            return
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def fan_out(recipe):
+    if is_pulled(recipe.author_id):
+        return
+    followers = Subscriptions.objects.filter(
+        subscriber_id=recipe.author_id).values_list('user_id', flat=True)
+    create_entries(
+        TimelineEntry(user_id=user_id, recipe_id=recipe.id,
+                      pub_date=recipe.pub_date)
+        for user_id in followers.iterator())
+
+
+def recipe_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        fan_out(instance)
+
+
+def backfill(user_id, author_id):
+    if is_pulled(author_id):
+        return
+    recipes = Recipe.objects.filter(author_id=author_id).values_list(
+        'id', 'pub_date')
+    create_entries(
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                      pub_date=pub_date)
+        for recipe_id, pub_date in recipes.iterator())
+
+
+def fill(subscriptions):
+    rows = subscriptions.filter(
+        subscriber__recipes__isnull=False,
+        subscriber__profile__followers_count__lte=(
+            settings.TIMELINE_FANOUT_LIMIT),
+    ).values_list('user_id', 'subscriber__recipes__id',
+                  'subscriber__recipes__pub_date')
+    create_entries(
+        TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                      pub_date=pub_date)
+        for user_id, recipe_id, pub_date in rows.iterator())
+
+
+def resume_fan_out(author_id):
+    # Автор вернулся к порогу рассылки: рецепты, опубликованные, пока
+    # они читались напрямую, добавляются в ленты подписчиков.
+    if Profile.objects.filter(
+            user_id=author_id,
+            followers_count=settings.TIMELINE_FANOUT_LIMIT).exists():
+        fill(Subscriptions.objects.filter(subscriber_id=author_id))
+
+
+def remove(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id).delete()
+
+
+class Feed:
+    def __init__(self, queryset, user, pulled_authors, cursor=None):
+        self.queryset = queryset
+        self.user = user
+        self.pulled_authors = pulled_authors
+        self.cursor = cursor
+
+    def after(self, pub_date, pk):
+        return Feed(self.queryset, self.user, self.pulled_authors,
+                    (pub_date, pk))
+
+    def get_before_cursor(self, pk_field):
+        if self.cursor is None:
+            return Q()
+        pub_date, pk = self.cursor
+        return Q(pub_date__lt=pub_date) | Q(
+            pub_date=pub_date, **{f'{pk_field}__lt': pk})
+
+    def get_sources(self):
+        # Записи ленты читаются по индексу (user, -pub_date, -recipe),
+        # рецепты авторов без рассылки - отдельным запросом.
+        entries = TimelineEntry.objects.filter(
+            self.get_before_cursor('recipe_id'), user=self.user)
+        if self.queryset.query.has_filters():
+            entries = entries.filter(recipe__in=self.queryset.values('id'))
+        if self.pulled_authors:
+            entries = entries.exclude(
+                recipe__author_id__in=self.pulled_authors)
+        sources = [entries.order_by('-pub_date', '-recipe_id').values_list(
+            'recipe_id', 'pub_date')]
+        if self.pulled_authors:
+            sources.append(self.queryset.filter(
+                self.get_before_cursor('id'),
+                author_id__in=self.pulled_authors,
+            ).order_by('-pub_date', '-id').values_list('id', 'pub_date'))
+        return sources
+
+    def count(self):
+        return sum(source.count() for source in self.get_sources())
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        rows = heapq.merge(
+            *(source[:stop] for source in self.get_sources()),
+            key=lambda row: (row[1], row[0]), reverse=True)
+        ids = [recipe_id for recipe_id, _ in islice(rows, start, stop)]
+        recipes = self.queryset.in_bulk(ids)
+        return [recipes[recipe_id] for recipe_id in ids
+                if recipe_id in recipes]
+
+
+def get_feed(queryset, user):
+    pulled_authors = Subscriptions.objects.filter(
+        user=user,
+        subscriber__profile__followers_count__gt=(
+            settings.TIMELINE_FANOUT_LIMIT)
+    ).values_list('subscriber_id', flat=True)
+    return Feed(queryset, user, list(pulled_authors))
@@ -0,0 +1,59 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Favorite, ShoppingCart
+
+
+class UserRecipeIds:
+    def __init__(self, model, name):
+        self.model = model
+        self.name = name
+
+    def get_version_key(self, user_id):
+        return f'user_recipes:{self.name}:{user_id}:version'
+
+    def get_version(self, user_id):
+        version_key = self.get_version_key(user_id)
+        version = cache.get(version_key)
+        if version is None:
+            cache.add(version_key, time.time_ns(), None)
+            version = cache.get(version_key)
+        return version
+
+    def load(self, user_id):
+        # Версия читается до запроса к БД: если запись закоммитится
+        # в процессе, устаревший набор останется под старой версией.
+        key = f'user_recipes:{self.name}:{user_id}:{self.get_version(user_id)}'
+        ids = cache.get(key)
+        if ids is None:
+            ids = set(self.model.objects.filter(
+                user_id=user_id).values_list('recipe_id', flat=True))
+            cache.set(key, ids, settings.USER_RECIPE_IDS_TIMEOUT)
+        return ids
+
+    def get(self, request):
+        if not request.user.is_authenticated:
+            return set()
+        attr = f'_{self.name}_ids'
+        ids = getattr(request, attr, None)
+        if ids is None:
+            ids = self.load(request.user.id)
+            setattr(request, attr, ids)
+        return ids
+
+    def bump(self, user_id):
+        version_key = self.get_version_key(user_id)
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            cache.add(version_key, time.time_ns(), None)
+
+    def invalidate(self, user_id):
+        transaction.on_commit(lambda: self.bump(user_id))
+
+
+favorite_ids = UserRecipeIds(Favorite, 'favorite')
+shopping_cart_ids = UserRecipeIds(ShoppingCart, 'shopping_cart')
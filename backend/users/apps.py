@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from django.db.models.signals import post_save
+
+        from recipes.models import User
+        from .signals import create_profile
+
+        post_save.connect(create_profile, sender=User,
+                          dispatch_uid='create_user_profile')
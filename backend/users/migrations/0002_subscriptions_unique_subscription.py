@@ -0,0 +1,31 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:10
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicates(apps, schema_editor):
+    for model_name, fields in (('Subscriptions', ('user', 'subscriber')),):
+        model = apps.get_model('users', model_name)
+        duplicates = model.objects.values(*fields).annotate(
+            min_id=Min('id'), count=Count('id')).filter(count__gt=1)
+        for row in duplicates:
+            model.objects.filter(
+                **{field: row[field] for field in fields}
+            ).exclude(id=row['min_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates,
+                             migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='subscriptions',
+            constraint=models.UniqueConstraint(fields=('user', 'subscriber'), name='unique_subscription'),
+        ),
+    ]
@@ -20,3 +20,26 @@ class Subscriptions(models.Model):
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
         ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'subscriber'],
+                                    name='unique_subscription'),
+        ]
+
+
+class Profile(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='profile'
+    )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число рецептов')
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписчиков')
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
@@ -0,0 +1,6 @@
+from .models import Profile
+
+
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)